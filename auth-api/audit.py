@@ -0,0 +1,235 @@
+"""审计日志异步写入：请求线程只把原始记录放入有界队列，脱敏、序列化与写出由后台线程批量完成。
+AUDIT_SINK（逗号分隔，可同时启用多个，默认 log,db）：
+- log：经 logger 输出 [AUTH-AUDIT] 行（格式与原先一致）
+- file：JSONL 文件，超过 AUDIT_FILE_MAX_BYTES 按 .1 .. .N 轮转
+- db：批量 INSERT 到 audit_log 表，供 GET /admin/audit 查询
+队列满时丢弃并计入 audit_dropped_total；stop() 会写完队列中剩余记录后再返回。
+调用方传入的 response 在入队后不应再被修改（当前调用点均为即时构造的字典）。
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Optional
+
+import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_SECRET_KEYS = ("password", "token", "secret", "refresh_token", "access_token")
+
+_dropped = metrics.Counter("audit_dropped_total", "Audit records dropped because the queue was full")
+_written = metrics.Counter("audit_written_total", "Audit records written by the background writer", ("sink",))
+
+_queue: "queue.Queue" = queue.Queue(maxsize=max(1, settings.AUDIT_QUEUE_SIZE))
+_STOP = object()  # 只用于唤醒空闲阻塞在 get() 上的写线程；停止与否以 _stopping 为准
+_stopping = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def mask_response(obj: Any) -> Any:
+    """对 response 中 password/token 等字段脱敏。"""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        out = {}
+        for k, v in obj.items():
+            key_lower = (k or "").lower()
+            if any(x in key_lower for x in _SECRET_KEYS):
+                out[k] = "***"
+            else:
+                out[k] = mask_response(v)
+        return out
+    if isinstance(obj, list):
+        return [mask_response(x) for x in obj]
+    return obj
+
+
+def _masked(response: Any) -> Any:
+    try:
+        return mask_response(response)
+    except Exception:
+        return "<serialize_error>"
+
+
+def _response_str(masked: Any) -> str:
+    if isinstance(masked, (dict, list)):
+        try:
+            return json.dumps(masked, ensure_ascii=False, default=str)
+        except Exception:
+            return "<serialize_error>"
+    return str(masked)
+
+
+def record(
+    request_id: str,
+    url: str,
+    action: str,
+    target_user: Optional[str],
+    status: str,
+    response: Any,
+) -> None:
+    """入队一条审计记录（不阻塞）；队列满时丢弃并计数。写线程未启动（如脚本中调用）时直接同步写出。"""
+    item = (datetime.utcnow(), request_id, url, action, target_user or "", status, response)
+    if _thread is None:
+        _flush([item])
+        return
+    try:
+        _queue.put_nowait(item)
+    except queue.Full:
+        _dropped.inc()
+
+
+# ----- 写出端 -----
+def _write_log(rows: list) -> None:
+    for ts, request_id, url, action, target_user, status, response in rows:
+        logger.info(
+            "[AUTH-AUDIT] requestId=%s url=%s action=%s targetUser=%s status=%s response=%s",
+            request_id, url, action, target_user, status, _response_str(response),
+        )
+
+
+def _rotate(path: str) -> None:
+    backups = max(0, settings.AUDIT_FILE_BACKUPS)
+    if backups == 0:
+        os.remove(path)
+        return
+    for i in range(backups - 1, 0, -1):
+        src = f"{path}.{i}"
+        if os.path.exists(src):
+            os.replace(src, f"{path}.{i + 1}")
+    os.replace(path, f"{path}.1")
+
+
+def _write_file(rows: list) -> None:
+    path = settings.AUDIT_FILE_PATH
+    lines = "".join(
+        json.dumps(
+            {
+                "ts": ts.isoformat() + "Z",
+                "requestId": request_id,
+                "url": url,
+                "action": action,
+                "targetUser": target_user,
+                "status": status,
+                "response": response,
+            },
+            ensure_ascii=False,
+            default=str,
+        )
+        + "\n"
+        for ts, request_id, url, action, target_user, status, response in rows
+    )
+    if os.path.exists(path) and os.path.getsize(path) >= settings.AUDIT_FILE_MAX_BYTES:
+        _rotate(path)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(lines)
+
+
+def _write_db(rows: list) -> None:
+    from database import SessionLocal
+    from models import AuditLog
+
+    db = SessionLocal()
+    try:
+        db.execute(
+            AuditLog.__table__.insert(),
+            [
+                {
+                    "ts": ts,
+                    "request_id": request_id,
+                    "url": url[:1024] if url else url,
+                    "action": action,
+                    "target_user": target_user,
+                    "status": status,
+                    "response": _response_str(response),
+                }
+                for ts, request_id, url, action, target_user, status, response in rows
+            ],
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+_SINKS = {"log": _write_log, "file": _write_file, "db": _write_db}
+_enabled_sinks = [n for n in (x.strip() for x in settings.AUDIT_SINK.split(",")) if n in _SINKS] or ["log"]
+
+
+def _flush(batch: list) -> None:
+    rows = [item[:6] + (_masked(item[6]),) for item in batch]
+    for sink in _enabled_sinks:
+        try:
+            _SINKS[sink](rows)
+            _written.inc(sink, amount=len(rows))
+        except Exception:
+            logger.exception("audit sink %s failed", sink)
+            if "log" not in _enabled_sinks:
+                _write_log(rows)
+
+
+def _drain_rest(batch: list) -> None:
+    while True:
+        try:
+            item = _queue.get_nowait()
+        except queue.Empty:
+            return
+        if item is not _STOP:
+            batch.append(item)
+
+
+def _run() -> None:
+    batch_size = max(1, settings.AUDIT_BATCH_SIZE)
+    interval = max(0.0, settings.AUDIT_FLUSH_INTERVAL_SECONDS)
+    while True:
+        # 空闲时阻塞等待；拿到第一条后最多再等 interval 秒凑批
+        item = _queue.get()
+        batch = [] if item is _STOP else [item]
+        deadline = time.monotonic() + interval
+        while not _stopping.is_set() and len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = _queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        stopping = _stopping.is_set()
+        if stopping:
+            _drain_rest(batch)
+        for i in range(0, len(batch), batch_size):
+            _flush(batch[i:i + batch_size])
+        if stopping:
+            return
+
+
+def start() -> None:
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _stopping.clear()
+        _thread = threading.Thread(target=_run, name="audit-writer", daemon=True)
+        _thread.start()
+
+
+def stop(timeout: float = 10.0) -> None:
+    """写完队列中的记录后停止写线程。"""
+    global _thread
+    thread, _thread = _thread, None
+    if thread is None:
+        return
+    # 此后的 record() 同步写出。停止以 Event 通知，不依赖队列有空位；
+    # 队列满时写线程必然不空闲，写完当前批即会看到 _stopping，唤醒哨兵入队失败可忽略
+    _stopping.set()
+    try:
+        _queue.put_nowait(_STOP)
+    except queue.Full:
+        pass
+    thread.join(timeout)
+    if thread.is_alive():
+        logger.warning("audit writer did not stop within %.1fs, %d records pending", timeout, _queue.qsize())
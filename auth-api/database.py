@@ -1,19 +1,165 @@
-"""SQLAlchemy 引擎与会话，启动时创建表"""
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import declarative_base, sessionmaker
+"""SQLAlchemy 引擎与会话，启动时执行 schema 迁移（migrations）。
+异步模式：DATABASE_URL 使用异步驱动（sqlite+aiosqlite / mysql+aiomysql）或 DB_ASYNC=true 时，
+额外创建 AsyncEngine，get_async_db 产出 AsyncSession；同步引擎仍保留给建表与后台任务。
+SQLite 单写者模式优先于异步模式：此时不建 AsyncEngine，get_async_db 仍为线程池包装的 RoutingSession。
+SQLite 单写者模式（SQLITE_SINGLE_WRITER，默认开启）：engine 只有一个写连接，并发写事务在连接池上排队，
+不再在文件锁上互相 busy 失败；read_engine 为只读连接池（query_only）。SessionLocal 在事务内第一次写之前
+把读路由到 read_engine，此后（含 flush）都走写连接。WAL + synchronous=NORMAL 下 commit 只追加 WAL、
+不逐个 fsync，由 checkpoint 成组落盘。写连接等待超过 pool_timeout 时抛 sqlalchemy TimeoutError，main 中映射为 503。
+"""
+import logging
+from typing import Any, Callable
 
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+import metrics
 from config import settings
-from models import Base
+
+logger = logging.getLogger(__name__)
+
+# backend -> (同步驱动, 异步驱动)
+_DRIVERS = {
+    "sqlite": ("sqlite", "sqlite+aiosqlite"),
+    "mysql": ("mysql+pymysql", "mysql+aiomysql"),
+}
+_ASYNC_DRIVER_NAMES = ("aiosqlite", "aiomysql", "asyncmy")
+
+_db_url = make_url(settings.DATABASE_URL.strip())
+_backend = _db_url.get_backend_name()
+_is_async_driver = _db_url.get_driver_name() in _ASYNC_DRIVER_NAMES
+ASYNC_MODE = settings.DB_ASYNC or _is_async_driver
+if _backend in _DRIVERS:
+    _sync_url = _db_url.set(drivername=_DRIVERS[_backend][0]) if _is_async_driver else _db_url
+    _async_url = _db_url if _is_async_driver else _db_url.set(drivername=_DRIVERS[_backend][1])
+else:
+    _sync_url = _async_url = _db_url
 
 _url = settings.DATABASE_URL.strip().lower()
 _connect_args = {"check_same_thread": False} if _url.startswith("sqlite") else {}
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args=_connect_args,
-    pool_pre_ping=True,
-    pool_recycle=300,
+_sqlite_memory = _backend == "sqlite" and (_db_url.database or ":memory:") == ":memory:"
+SQLITE_SINGLE_WRITER = settings.SQLITE_SINGLE_WRITER and _backend == "sqlite" and not _sqlite_memory
+# 写引擎（QueuePool）配置的 max_overflow，供连接池饱和指标使用；None 为非 QueuePool（:memory: 的 SingletonThreadPool）
+_engine_max_overflow = None if _sqlite_memory else (0 if SQLITE_SINGLE_WRITER else 10)
+if SQLITE_SINGLE_WRITER:
+    engine = create_engine(
+        _sync_url,
+        connect_args=_connect_args,
+        pool_size=1,
+        max_overflow=_engine_max_overflow,
+        pool_timeout=30,
+    )
+    read_engine = create_engine(
+        _sync_url,
+        connect_args=_connect_args,
+        pool_size=max(1, settings.SQLITE_READ_POOL_SIZE),
+        max_overflow=0,
+    )
+else:
+    engine = create_engine(
+        _sync_url,
+        connect_args=_connect_args,
+        pool_pre_ping=True,
+        pool_recycle=300,
+        **({} if _engine_max_overflow is None else {"max_overflow": _engine_max_overflow}),
+    )
+    read_engine = engine
+
+
+def _sqlite_pragmas(dbapi_conn, read_only: bool) -> None:
+    cursor = dbapi_conn.cursor()
+    try:
+        if not read_only:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+    finally:
+        cursor.close()
+
+
+if SQLITE_SINGLE_WRITER:
+    event.listen(engine, "connect", lambda dbapi_conn, record: _sqlite_pragmas(dbapi_conn, False))
+    event.listen(read_engine, "connect", lambda dbapi_conn, record: _sqlite_pragmas(dbapi_conn, True))
+
+
+def _is_write(clause: Any) -> bool:
+    if clause is None:
+        return False
+    if getattr(clause, "is_text", False):
+        return clause.text.lstrip()[:6].upper() not in ("SELECT", "WITH")
+    return not getattr(clause, "is_select", False)
+
+
+class RoutingSession(Session):
+    """单写者模式下的会话：事务内第一次写之前的读走只读连接池，写（含 flush）及其后的语句走写连接，
+    保证读到本事务自己的写入；事务结束后重新从只读池开始。非单写者模式下等同普通 Session。"""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if read_engine is engine:
+            return engine
+        if self.info.get("writer") or self._flushing or _is_write(clause):
+            self.info["writer"] = True
+            return engine
+        return read_engine
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _reset_route(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("writer", None)
+
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+
+
+# ----- 连接池指标（GET /metrics） -----
+_pool_checkouts = metrics.Counter("db_pool_checkouts_total", "Connections checked out from the pool")
+_pool_saturated = metrics.Counter(
+    "db_pool_saturated_checkouts_total",
+    "Checkouts that left the pool at capacity (next request waits up to pool_timeout)",
+)
+
+
+@event.listens_for(engine, "checkout")
+def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+    _pool_checkouts.inc()
+    if _engine_max_overflow is not None and engine.pool.checkedout() >= engine.pool.size() + _engine_max_overflow:
+        _pool_saturated.inc()
+
+
+def _pool_metrics() -> list:
+    pool = engine.pool
+    if not hasattr(pool, "checkedout"):
+        return []
+    return (
+        metrics.gauge("db_pool_size", "Configured pool size", pool.size())
+        + metrics.gauge("db_pool_checked_out", "Connections currently checked out", pool.checkedout())
+        + metrics.gauge("db_pool_checked_in", "Idle connections in the pool", pool.checkedin())
+        + metrics.gauge("db_pool_overflow", "Current overflow connections (negative: unopened slots)", pool.overflow())
+    )
+
+
+metrics.register_collector(_pool_metrics)
+
+# 单写者模式下不建异步引擎：它会是绕过唯一写连接的第二个连接池；async 路由改用线程池包装的 RoutingSession
+async_engine = (
+    create_async_engine(_async_url, connect_args=_connect_args, pool_pre_ping=True, pool_recycle=300)
+    if ASYNC_MODE and not SQLITE_SINGLE_WRITER
+    else None
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = (
+    async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    if async_engine is not None
+    else None
+)
+# 非异步模式下 get_async_db 使用的会话：commit 后不过期，避免在事件循环里隐式懒加载
+_ThreadedSessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, expire_on_commit=False)
 
 
 def get_db():
@@ -24,49 +170,42 @@ def get_db():
         db.close()
 
 
-def create_tables():
-    Base.metadata.create_all(bind=engine)
-    _ensure_user_status_columns()
-    _ensure_trials_table()
-def _ensure_trials_table():
-    """SQLite：创建 trials 表（id, username UNIQUE, start_ts, end_ts），供 POST /auth/trial/start 使用。"""
-    if not _url.startswith("sqlite"):
-        return
-    with engine.begin() as conn:
-        conn.execute(
-            text(
-                "CREATE TABLE IF NOT EXISTS trials("
-                "id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE, start_ts INTEGER, end_ts INTEGER)"
-            )
-        )
-def _ensure_user_status_columns():
-    """SQLite：为 users 表补列 plan/status/created_at/trial_*（如不存在）；对已有用户补默认值。不引入迁移系统。"""
-    if not _url.startswith("sqlite"):
+class ThreadedSession:
+    """非异步模式下与 AsyncSession 对齐的最小接口：run_sync 把同步函数放到线程池执行。"""
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    async def run_sync(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.sync_session.close)
+
+
+async def get_async_db():
+    """async 路由使用：统一通过 `await db.run_sync(fn, ...)` 访问数据库，fn 第一个参数为同步 Session。
+    异步模式下为 AsyncSession（I/O 等待只占协程）；否则为线程池包装的同步 Session。"""
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            yield session
         return
-    with engine.begin() as conn:
-        exists = conn.execute(
-            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name='users'")
-        ).fetchone()
-        if not exists:
-            return
-        result = conn.execute(text("PRAGMA table_info(users)"))
-        rows = result.fetchall()
-        columns = [row[1] for row in rows] if rows else []
-        if "created_at" not in columns:
-            conn.execute(text("ALTER TABLE users ADD COLUMN created_at TEXT"))
-            conn.execute(text("UPDATE users SET created_at = datetime('now') WHERE created_at IS NULL OR created_at = ''"))
-        if "status" not in columns:
-            conn.execute(text("ALTER TABLE users ADD COLUMN status TEXT DEFAULT 'active'"))
-            conn.execute(text("UPDATE users SET status = 'active' WHERE status IS NULL OR status = ''"))
-        if "plan" not in columns:
-            conn.execute(text("ALTER TABLE users ADD COLUMN plan TEXT DEFAULT 'free'"))
-        if "trial_start_at" not in columns:
-            conn.execute(text("ALTER TABLE users ADD COLUMN trial_start_at TEXT"))
-        if "trial_end_at" not in columns:
-            conn.execute(text("ALTER TABLE users ADD COLUMN trial_end_at TEXT"))
-        # 老数据补 created_at
-        conn.execute(
-            text(
-                "UPDATE users SET created_at = datetime('now') WHERE created_at IS NULL OR created_at = ''"
-            )
-        )
\ No newline at end of file
+    db = ThreadedSession(_ThreadedSessionLocal())
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+async def dispose_engines() -> None:
+    if async_engine is not None:
+        await async_engine.dispose()
+
+
+def create_tables():
+    """启动时执行未应用的 schema 迁移（见 migrations）；已是最新版本时只读一次 schema_version。"""
+    # 迁移步骤依赖 entitlements / search_index，它们又依赖本模块的 engine
+    import migrations
+
+    version = migrations.upgrade(engine)
+    logger.info("schema version %d", version)
@@ -1,19 +1,29 @@
 """JWT 与依赖：access_token 解析、get_current_user、refresh 校验；管理员 admin token 与审计日志"""
-import json
+import hashlib
 import logging
+import time
 import uuid
 from datetime import datetime, timedelta
 from typing import Any, Optional
 
-import bcrypt
 from jose import JWTError, jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, Response, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.orm import Session
-
+from starlette.concurrency import run_in_threadpool
+
+import audit
+import entitlements
+import jwt_cache
+import login_limiter
+import password_hasher
+import signing_keys
+import token_epochs
+import user_cache
 from config import settings
-from database import get_db
-from models import User
+from database import get_async_db, get_db
+from models import Entitlement, User
+from user_cache import UserSnapshot
 
 security = HTTPBearer(auto_error=False)
 logger = logging.getLogger(__name__)
@@ -24,23 +34,101 @@ def _admin_jwt_secret() -> str:
 
 
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    return password_hasher.bcrypt_hash(password)
 
 
 def verify_password(plain: str, hashed: str) -> bool:
-    return bcrypt.checkpw(plain.encode("utf-8"), hashed.encode("utf-8"))
+    return password_hasher.bcrypt_verify(plain, hashed)
+
+
+def err_server_busy() -> dict:
+    return {"code": "server_busy", "message": "服务繁忙，请稍后重试"}
+
+
+def _raise_hasher_busy() -> None:
+    raise HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=err_server_busy(),
+        headers={"Retry-After": "1"},
+    )
+
+
+async def hash_password_async(password: str) -> str:
+    """在 bcrypt 进程池中计算 hash；队列已满时返回 503。"""
+    try:
+        return await password_hasher.hash_password(password)
+    except password_hasher.PasswordHasherBusy:
+        _raise_hasher_busy()
+
+
+async def verify_password_async(plain: str, hashed: str, limit: Optional[int] = None) -> bool:
+    """在 bcrypt 进程池中校验密码；队列已满（或超过调用方 limit）时返回 503。"""
+    try:
+        return await password_hasher.verify_password(plain, hashed, limit=limit)
+    except password_hasher.PasswordHasherBusy:
+        _raise_hasher_busy()
+
 
+# ----- 登录准入控制 -----
+def err_too_many_attempts() -> dict:
+    return {"code": "too_many_attempts", "message": "登录尝试过于频繁，请稍后再试"}
 
-def create_access_token(user_id: str) -> str:
+
+def client_ip(request: Request) -> Optional[str]:
+    """客户端 IP：TRUST_PROXY_HEADERS 开启时取 X-Forwarded-For 第一跳或 X-Real-IP，否则取对端地址。"""
+    if settings.TRUST_PROXY_HEADERS:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip() or None
+        real_ip = request.headers.get("x-real-ip")
+        if real_ip:
+            return real_ip.strip()
+    return request.client.host if request.client else None
+
+
+async def check_login_rate(request: Request, identifier: str) -> None:
+    """按账号与 IP 的滑动窗口限流（多 worker 共享），超限抛 429 并带 Retry-After。"""
+    rejected = await run_in_threadpool(login_limiter.check, identifier, client_ip(request))
+    if rejected is not None:
+        _, retry_after = rejected
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=err_too_many_attempts(),
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+def entitlement_claims(snapshot: UserSnapshot) -> dict:
+    """access_token 内嵌的权益 claims：签发时的有效套餐、试用结束与付费到期（unix 秒，无则 null）、权益版本 ev。
+    客户端可据此本地判断套餐与试用，不必轮询 /auth/status。"""
+    return {
+        "plan": entitlements.effective_plan(snapshot.plan, snapshot.trial_end_ts, snapshot.subscription_expires_ts),
+        "trial_end": snapshot.trial_end_ts,
+        "plan_exp": snapshot.subscription_expires_ts,
+        "ev": snapshot.entitlement_version,
+    }
+
+
+def create_access_token(user_id: str, snapshot: Optional[UserSnapshot] = None) -> str:
+    """te 为签发时的 token 纪元（见 token_epochs）；传入用户快照时内嵌权益 claims（见 entitlement_claims）。"""
     expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    payload = {"sub": user_id, "exp": expire, "type": "access"}
+    epoch = token_epochs.current(user_id)
+    if snapshot is not None:
+        epoch = max(epoch, snapshot.token_epoch)
+    payload = {"sub": user_id, "exp": expire, "type": "access", "te": epoch}
+    if snapshot is not None:
+        payload.update(entitlement_claims(snapshot))
+    if signing_keys.enabled():
+        key, kid = signing_keys.signing_key()
+        return jwt.encode(payload, key, algorithm=signing_keys.ES256, headers={"kid": kid})
     return jwt.encode(payload, settings.JWT_SECRET, algorithm="HS256")
 
 
 def create_refresh_token(user_id: str) -> str:
     """JWT with type=refresh，与 login 相同 SECRET+算法，较长有效期（如 7d）"""
     expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    payload = {"sub": user_id, "exp": expire, "type": "refresh"}
+    # jti 保证同一秒内签发的 token 也互不相同（refresh_tokens 按 token_hash 区分）
+    payload = {"sub": user_id, "exp": expire, "type": "refresh", "jti": uuid.uuid4().hex}
     return jwt.encode(payload, settings.JWT_SECRET, algorithm="HS256")
 
 
@@ -55,38 +143,155 @@ def decode_refresh_token(token: str) -> Optional[str]:
         return None
 
 
-def decode_access_token(token: str) -> Optional[str]:
-    try:
-        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=["HS256"])
-        if payload.get("type") != "access":
-            return None
-        return payload.get("sub")
-    except JWTError:
+_access_token_cache = jwt_cache.DecodeCache("access", settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+
+def _verify_access_token(token: str) -> dict:
+    """ES256 按 header.kid 选公钥；HS256 用 JWT_SECRET，启用 ES256 后只在 JWT_HS256_ACCEPT_UNTIL 之前接受。"""
+    header = jwt.get_unverified_header(token)
+    if header.get("alg") == signing_keys.ES256:
+        key = signing_keys.verify_key(header.get("kid"))
+        if key is None:
+            raise JWTError("unknown kid")
+        return jwt.decode(token, key, algorithms=[signing_keys.ES256])
+    if not signing_keys.hs256_accepted():
+        raise JWTError("HS256 access token no longer accepted")
+    return jwt.decode(token, settings.JWT_SECRET, algorithms=["HS256"])
+
+
+def decode_access_claims(token: str) -> Optional[dict]:
+    """校验 access_token 并返回 claims（只读）；同一 token 在有效期内只做一次签名校验（jwt_cache）。
+    te 落后于用户当前 token 纪元（已禁用/重置密码/删除）视为无效，只查内存字典。"""
+    payload = _access_token_cache.decode(token, _verify_access_token)
+    if not payload or payload.get("type") != "access":
+        return None
+    if token_epochs.is_revoked(payload.get("sub"), payload.get("te")):
         return None
+    return payload
 
 
-def get_current_user(
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-    db: Session = Depends(get_db),
-) -> User:
-    if not credentials:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=err_token_invalid(),
-        )
-    user_id = decode_access_token(credentials.credentials)
-    if not user_id:
+def decode_access_token(token: str) -> Optional[str]:
+    payload = decode_access_claims(token)
+    return payload.get("sub") if payload else None
+
+
+def claims_from_credentials(credentials: Optional[HTTPAuthorizationCredentials]) -> dict:
+    """解析 Bearer access_token 返回 claims（含 sub），失败抛 401。"""
+    payload = decode_access_claims(credentials.credentials) if credentials else None
+    if not payload or not payload.get("sub"):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=err_token_invalid(),
         )
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user or user.status != "active":
+    return payload
+
+
+def user_id_from_credentials(credentials: Optional[HTTPAuthorizationCredentials]) -> str:
+    """解析 Bearer access_token，失败抛 401。"""
+    return claims_from_credentials(credentials)["sub"]
+
+
+def claims_current(claims: dict) -> bool:
+    """token 带 ev 且与本进程已知的权益版本一致：其中的权益 claims 可直接使用，无需读库。"""
+    ev = claims.get("ev")
+    return ev is not None and ev == user_cache.entitlement_version(claims["sub"])
+
+
+def load_user_snapshot(db: Session, user_id: str) -> Optional[UserSnapshot]:
+    """先查用户快照缓存，未命中再按主键读库（users JOIN entitlements，均为主键查找）并回填。"""
+    snapshot = user_cache.get(user_id)
+    if snapshot is not None:
+        return snapshot
+    row = (
+        db.query(User, Entitlement)
+        .outerjoin(Entitlement, Entitlement.user_id == User.id)
+        .filter(User.id == user_id)
+        .first()
+    )
+    if not row:
+        return None
+    return user_cache.put(*row)
+
+
+def _require_active(snapshot: Optional[UserSnapshot]) -> UserSnapshot:
+    if not snapshot or snapshot.status != "active":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=err_token_invalid(),
         )
-    return user
+    return snapshot
+
+
+def load_active_user(db: Session, user_id: str) -> UserSnapshot:
+    """按 id 读取用户快照；不存在或非 active 抛 401。"""
+    return _require_active(load_user_snapshot(db, user_id))
+
+
+def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db: Session = Depends(get_db),
+) -> UserSnapshot:
+    """token 内嵌的权益 claims 不参与判断：快照（缓存或库）才是准的，ev 过期的 token 照常可用。"""
+    return load_active_user(db, user_id_from_credentials(credentials))
+
+
+async def get_current_user_async(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db=Depends(get_async_db),
+) -> UserSnapshot:
+    """get_current_user 的 async 版本，供 async 路由使用（与路由共享同一个 get_async_db 会话）。
+    快照缓存命中时不访问数据库。"""
+    user_id = user_id_from_credentials(credentials)
+    snapshot = user_cache.get(user_id)
+    if snapshot is None:
+        snapshot = await db.run_sync(load_user_snapshot, user_id)
+    return _require_active(snapshot)
+
+
+# ----- 状态接口 ETag（条件 GET） -----
+def _expiry_state(ts: Optional[int], now_ts: int) -> str:
+    if ts is None:
+        return "none"
+    return "active" if ts > now_ts else "expired"
+
+
+def _trial_state(snapshot: UserSnapshot) -> str:
+    """试用/订阅到期不会触发 state_version 变化，单独折算进 ETag：none / active / expired。"""
+    now_ts = int(time.time())
+    return _expiry_state(snapshot.trial_end_ts, now_ts) + "/" + _expiry_state(snapshot.subscription_expires_ts, now_ts)
+
+
+def _etag(parts: list) -> str:
+    return '"' + hashlib.sha256("|".join(parts).encode()).hexdigest()[:32] + '"'
+
+
+def status_etag(kind: str, snapshot: UserSnapshot, *extra: Any) -> str:
+    """强 ETag：由接口类型、user_id、state_version、试用状态（及额外参数）派生，不依赖响应体。"""
+    return _etag([kind, snapshot.id, str(snapshot.state_version), _trial_state(snapshot), *map(str, extra)])
+
+
+def claims_etag(kind: str, claims: dict) -> str:
+    """按 token 权益 claims 应答时的 ETag：由权益版本 ev 与试用/订阅到期状态派生。"""
+    now_ts = int(time.time())
+    state = _expiry_state(claims.get("trial_end"), now_ts) + "/" + _expiry_state(claims.get("plan_exp"), now_ts)
+    return _etag([kind, claims["sub"], "ev" + str(claims.get("ev")), state])
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match 是否命中（支持逗号分隔多个值与 *）。"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [c.strip() for c in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=etag_headers(etag))
+
+
+def etag_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
 
 
 def err_token_invalid() -> dict:
@@ -104,15 +309,17 @@ def create_admin_token() -> str:
     return jwt.encode(payload, _admin_jwt_secret(), algorithm="HS256")
 
 
+_admin_token_cache = jwt_cache.DecodeCache("admin", ADMIN_TOKEN_EXPIRE_HOURS * 3600)
+
+
 def decode_admin_token(token: str) -> Optional[str]:
     """校验 admin token，成功返回 sub（管理员名）。"""
-    try:
-        payload = jwt.decode(token, _admin_jwt_secret(), algorithms=["HS256"])
-        if payload.get("type") != "admin":
-            return None
-        return payload.get("sub")
-    except JWTError:
+    payload = _admin_token_cache.decode(
+        token, lambda t: jwt.decode(t, _admin_jwt_secret(), algorithms=["HS256"])
+    )
+    if not payload or payload.get("type") != "admin":
         return None
+    return payload.get("sub")
 
 
 def get_current_admin(
@@ -133,25 +340,29 @@ def get_current_admin(
     return admin_sub
 
 
-# ----- 审计日志（脱敏） -----
-def _mask_response(obj: Any) -> Any:
-    """对 response 中 password/token 等字段脱敏。"""
-    if obj is None:
-        return None
-    if isinstance(obj, dict):
-        out = {}
-        for k, v in obj.items():
-            key_lower = (k or "").lower()
-            if any(x in key_lower for x in ("password", "token", "secret", "refresh_token", "access_token")):
-                out[k] = "***"
-            else:
-                out[k] = _mask_response(v)
-        return out
-    if isinstance(obj, list):
-        return [_mask_response(x) for x in obj]
-    return obj
+_service_token_hashes = frozenset(
+    hashlib.sha256(t.strip().encode()).digest() for t in settings.SERVICE_TOKENS.split(",") if t.strip()
+)
+
+
+def get_admin_or_service(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+) -> str:
+    """依赖：admin token 或 SERVICE_TOKENS 中的服务 token；返回调用方标识（管理员名或 "service"）。"""
+    if credentials and credentials.credentials:
+        token = credentials.credentials.strip()
+        if hashlib.sha256(token.encode()).digest() in _service_token_hashes:
+            return "service"
+        admin_sub = decode_admin_token(token)
+        if admin_sub:
+            return admin_sub
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail={"code": "admin_unauthorized", "message": "需要管理员或服务 token"},
+    )
 
 
+# ----- 审计日志（脱敏） -----
 def auth_audit_log(
     request_id: str,
     url: str,
@@ -160,16 +371,6 @@ def auth_audit_log(
     status: str,
     response: Any,
 ) -> None:
-    """写入审计日志：[AUTH-AUDIT] requestId、url、action、targetUser、status、response（脱敏）。"""
-    try:
-        masked = _mask_response(response)
-        if isinstance(masked, (dict, list)):
-            response_str = json.dumps(masked, ensure_ascii=False, default=str)
-        else:
-            response_str = str(masked)
-    except Exception:
-        response_str = "<serialize_error>"
-    logger.info(
-        "[AUTH-AUDIT] requestId=%s url=%s action=%s targetUser=%s status=%s response=%s",
-        request_id, url, action, target_user or "", status, response_str,
-    )
+    """写入审计日志：[AUTH-AUDIT] requestId、url、action、targetUser、status、response（脱敏）。
+    只入队，脱敏与写出由 audit 模块的后台线程批量完成。"""
+    audit.record(request_id, url, action, target_user, status, response)
@@ -0,0 +1,206 @@
+"""用户权益（entitlements 表）读写：注册建行、开通/延长试用、设置套餐、有效套餐计算、迁移回填。
+写操作不 commit，由调用方与 state_version 自增放在同一事务中提交，提交后再 invalidate 用户快照。
+每次变更 version +1，签发时写入 access_token（ev claim），旧 token 的权益 claims 据此判定过期。
+"""
+import logging
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import MetaData, Table, case, func, inspect, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from models import Entitlement, Subscription, User
+
+logger = logging.getLogger(__name__)
+
+FREE = "free"
+TRIAL = "trial"
+_BACKFILL_BATCH = 1000
+
+
+def effective_plan(
+    plan: Optional[str],
+    trial_end_ts: Optional[int],
+    subscription_expires_ts: Optional[int],
+    now_ts: Optional[int] = None,
+) -> str:
+    """对外展示的套餐：付费套餐未到期 > 试用中 > free。"""
+    now_ts = int(time.time()) if now_ts is None else now_ts
+    plan = plan or FREE
+    if plan not in (FREE, TRIAL) and (subscription_expires_ts is None or subscription_expires_ts > now_ts):
+        return plan
+    if trial_end_ts is not None and trial_end_ts > now_ts:
+        return TRIAL
+    return FREE
+
+
+def create(db: Session, user_id: str, plan: str = FREE) -> Entitlement:
+    row = Entitlement(user_id=user_id, plan=plan, version=0, updated_at=datetime.utcnow())
+    db.add(row)
+    return row
+
+
+def _get_or_create(db: Session, user_id: str) -> Entitlement:
+    row = db.get(Entitlement, user_id)
+    return row if row is not None else create(db, user_id)
+
+
+def _touch(row: Entitlement) -> None:
+    row.version = (row.version or 0) + 1
+    row.updated_at = datetime.utcnow()
+
+
+def start_trial(db: Session, user_id: str, days: int, now_ts: Optional[int] = None) -> tuple[int, bool]:
+    """试用未过期则返回 (当前 end_ts, False)；否则开通新 days 天并返回 (end_ts, True)。"""
+    now_ts = int(time.time()) if now_ts is None else now_ts
+    row = _get_or_create(db, user_id)
+    if row.trial_end_ts and row.trial_end_ts > now_ts:
+        return row.trial_end_ts, False
+    row.trial_start_ts = now_ts
+    row.trial_end_ts = now_ts + days * 24 * 3600
+    _touch(row)
+    return row.trial_end_ts, True
+
+
+def extend_trial(db: Session, user_id: str, days: int, now_ts: Optional[int] = None) -> int:
+    """试用中则在原 end_ts 上顺延，否则从现在起开通 days 天；返回新的 end_ts。"""
+    now_ts = int(time.time()) if now_ts is None else now_ts
+    row = _get_or_create(db, user_id)
+    if row.trial_end_ts and row.trial_end_ts > now_ts:
+        row.trial_end_ts += days * 24 * 3600
+    else:
+        row.trial_start_ts = now_ts
+        row.trial_end_ts = now_ts + days * 24 * 3600
+    _touch(row)
+    return row.trial_end_ts
+
+
+def expire_trial(db: Session, user_id: str, now_ts: Optional[int] = None) -> None:
+    now_ts = int(time.time()) if now_ts is None else now_ts
+    row = _get_or_create(db, user_id)
+    row.trial_start_ts = row.trial_start_ts or now_ts - 60
+    row.trial_end_ts = now_ts - 60
+    _touch(row)
+
+
+def set_plan(db: Session, user_id: str, plan: str, expires_ts: Optional[int] = None) -> None:
+    row = _get_or_create(db, user_id)
+    row.plan = plan
+    row.subscription_expires_ts = expires_ts
+    _touch(row)
+
+
+def delete(db: Session, user_id: str) -> None:
+    db.query(Entitlement).filter(Entitlement.user_id == user_id).delete(synchronize_session=False)
+
+
+# ----- 批量（管理端 /admin/users:bulk）：集合式 UPDATE，调用方负责分块与 commit -----
+def _ensure_rows(db: Session, user_ids: list) -> None:
+    existing = set(db.execute(select(Entitlement.user_id).where(Entitlement.user_id.in_(user_ids))).scalars())
+    missing = [uid for uid in user_ids if uid not in existing]
+    if missing:
+        now = datetime.utcnow()
+        db.execute(
+            Entitlement.__table__.insert(),
+            [{"user_id": uid, "plan": FREE, "version": 0, "updated_at": now} for uid in missing],
+        )
+
+
+def extend_trials(db: Session, user_ids: list, days: int, now_ts: Optional[int] = None) -> None:
+    """同 extend_trial：试用中则顺延，否则从现在起开通 days 天。"""
+    if not user_ids:
+        return
+    now_ts = int(time.time()) if now_ts is None else now_ts
+    _ensure_rows(db, user_ids)
+    seconds = days * 24 * 3600
+    active = func.coalesce(Entitlement.trial_end_ts, 0) > now_ts
+    # MySQL 单表 UPDATE 按书写顺序赋值，trial_start_ts 须先于 trial_end_ts（两者都依赖旧的 trial_end_ts）
+    db.execute(
+        update(Entitlement)
+        .where(Entitlement.user_id.in_(user_ids))
+        .ordered_values(
+            (Entitlement.trial_start_ts, case((active, Entitlement.trial_start_ts), else_=now_ts)),
+            (Entitlement.trial_end_ts, case((active, Entitlement.trial_end_ts + seconds), else_=now_ts + seconds)),
+            (Entitlement.version, func.coalesce(Entitlement.version, 0) + 1),
+            (Entitlement.updated_at, datetime.utcnow()),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def set_plans(db: Session, user_ids: list, plan: str, expires_ts: Optional[int] = None) -> None:
+    if not user_ids:
+        return
+    _ensure_rows(db, user_ids)
+    db.execute(
+        update(Entitlement)
+        .where(Entitlement.user_id.in_(user_ids))
+        .values(
+            plan=plan,
+            subscription_expires_ts=expires_ts,
+            version=func.coalesce(Entitlement.version, 0) + 1,
+            updated_at=datetime.utcnow(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def delete_many(db: Session, user_ids: list) -> None:
+    if user_ids:
+        db.query(Entitlement).filter(Entitlement.user_id.in_(user_ids)).delete(synchronize_session=False)
+
+
+# ----- 迁移回填：为缺少权益行的用户补齐（旧 trials 表、users.trial_*、subscriptions） -----
+def _ts(value: Optional[datetime]) -> Optional[int]:
+    if value is None:
+        return None
+    return int((value - datetime(1970, 1, 1)).total_seconds())
+
+
+def backfill(conn: Connection) -> int:
+    """迁移步骤：为缺少权益行的用户分批回填，返回回填行数。在迁移连接的事务内执行，不 commit。"""
+    legacy_trials = None
+    if inspect(conn).has_table("trials"):
+        legacy_trials = Table("trials", MetaData(), autoload_with=conn)
+    total = 0
+    while True:
+        cols = [User.id, User.plan, User.trial_start_at, User.trial_end_at,
+                Subscription.plan, Subscription.current_period_end]
+        q = (
+            select(*cols)
+            .outerjoin(Entitlement, Entitlement.user_id == User.id)
+            .outerjoin(Subscription, Subscription.user_id == User.id)
+            .where(Entitlement.user_id.is_(None))
+            .order_by(User.id)
+            .limit(_BACKFILL_BATCH)
+        )
+        if legacy_trials is not None:
+            q = q.add_columns(legacy_trials.c.start_ts, legacy_trials.c.end_ts).outerjoin(
+                legacy_trials, legacy_trials.c.username == User.id
+            )
+        rows = conn.execute(q).all()
+        if not rows:
+            break
+        now = datetime.utcnow()
+        values = []
+        for row in rows:
+            user_id, user_plan, start_at, end_at, sub_plan, period_end = row[:6]
+            start_ts, end_ts = (row[6], row[7]) if legacy_trials is not None else (None, None)
+            if start_ts is None or end_ts is None:
+                start_ts, end_ts = _ts(start_at), _ts(end_at)
+            paid = sub_plan if sub_plan and sub_plan not in (FREE, TRIAL) else None
+            values.append({
+                "user_id": user_id,
+                "plan": paid or (user_plan if user_plan and user_plan != TRIAL else FREE),
+                "trial_start_ts": int(start_ts) if start_ts is not None else None,
+                "trial_end_ts": int(end_ts) if end_ts is not None else None,
+                "subscription_expires_ts": _ts(period_end) if paid else None,
+                "version": 0,
+                "updated_at": now,
+            })
+        conn.execute(Entitlement.__table__.insert(), values)
+        total += len(values)
+    logger.info("backfilled %d entitlement rows", total)
+    return total
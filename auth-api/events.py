@@ -0,0 +1,208 @@
+"""权益变更事件（SSE，GET /auth/events）：status / plan / trial。
+- 本进程内的变更（开通试用、管理员禁用/启用/删除）由调用方 publish，立即推送
+- 后台扫描器每 EVENTS_SCAN_SECONDS 对“有订阅连接的用户”做一次批量查询：
+  state_version 变化（其他 worker 的写入）与试用到期都会在这里转成事件
+事件 id 形如 <进程标识>-<序号>；Last-Event-ID 属于本进程且仍在历史缓冲内时补发，否则下发 resync 让客户端重新拉取。
+事件是幂等通知，客户端收到后以 /auth/status 或事件数据为准，偶发重复无害。
+"""
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Optional
+
+from sqlalchemy import func, select
+from starlette.concurrency import run_in_threadpool
+
+import entitlements
+from cache import TTLCache
+from config import settings
+from database import SessionLocal
+from models import Entitlement, User
+
+logger = logging.getLogger(__name__)
+
+_BOOT = uuid.uuid4().hex[:8]
+_seq = itertools.count(1)
+_lock = threading.Lock()
+# user_id -> deque[Event]，只保留最近 EVENTS_HISTORY_SIZE 条，用于断线续传
+_history = TTLCache(maxsize=settings.EVENTS_HISTORY_USERS, ttl=3600)
+# user_id -> {(loop, queue)}
+_subscribers: dict = {}
+# user_id -> (state_version, status, plan, trial_end_ts)，扫描器比较用
+_known: dict = {}
+# 事件类型 -> 在 _known 中对应的位置与数据字段；本地 publish 同步更新，避免扫描器重复推送
+_KNOWN_FIELDS = {"status": (1, "status"), "plan": (2, "plan"), "trial": (3, "trialEndsAt")}
+
+
+@dataclass
+class Event:
+    type: str
+    data: dict
+    id: str = field(default_factory=lambda: f"{_BOOT}-{next(_seq)}")
+
+
+def format_sse(event: Event) -> str:
+    return f"id: {event.id}\nevent: {event.type}\ndata: {json.dumps(event.data, ensure_ascii=False)}\n\n"
+
+
+def _put(queue: asyncio.Queue, event: Event) -> None:
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        logger.warning("events queue full, dropping %s", event.type)
+
+
+def publish(user_id: str, event_type: str, data: dict) -> None:
+    """线程安全：可在路由线程池或事件循环中调用（应在 commit 之后）。"""
+    event = Event(type=event_type, data=data)
+    with _lock:
+        history = _history.get(user_id)
+        if history is None:
+            history = deque(maxlen=settings.EVENTS_HISTORY_SIZE)
+        history.append(event)
+        _history.set(user_id, history)
+        known = _known.get(user_id)
+        pos = _KNOWN_FIELDS.get(event_type)
+        if known is not None and pos is not None and pos[1] in data:
+            known = list(known)
+            known[pos[0]] = data[pos[1]]
+            _known[user_id] = tuple(known)
+        targets = list(_subscribers.get(user_id, ()))
+    for loop, queue in targets:
+        loop.call_soon_threadsafe(_put, queue, event)
+
+
+def _subscribe(user_id: str, known: tuple) -> tuple:
+    item = (asyncio.get_running_loop(), asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE))
+    with _lock:
+        _subscribers.setdefault(user_id, set()).add(item)
+        _known.setdefault(user_id, known)
+    return item
+
+
+def _unsubscribe(user_id: str, item: tuple) -> None:
+    with _lock:
+        subs = _subscribers.get(user_id)
+        if subs is None:
+            return
+        subs.discard(item)
+        if not subs:
+            del _subscribers[user_id]
+            _known.pop(user_id, None)
+
+
+def _replay_since(user_id: str, last_event_id: str) -> Optional[list]:
+    """返回 last_event_id 之后的事件；id 不属于本进程或已滚出缓冲时返回 None。"""
+    boot, _, seq = last_event_id.partition("-")
+    if boot != _BOOT or not seq.isdigit():
+        return None
+    with _lock:
+        history = list(_history.get(user_id) or ())
+    if history and int(history[0].id.partition("-")[2]) > int(seq) + 1:
+        return None
+    return [e for e in history if int(e.id.partition("-")[2]) > int(seq)]
+
+
+async def stream(
+    user_id: str,
+    known: tuple,
+    last_event_id: Optional[str],
+    is_disconnected: Callable,
+) -> AsyncIterator[str]:
+    """SSE 数据流：先补发，再推送实时事件；空闲时发心跳注释，最长 EVENTS_MAX_STREAM_SECONDS 后结束让客户端重连。"""
+    item = _subscribe(user_id, known)
+    queue = item[1]
+    try:
+        yield f"retry: {settings.EVENTS_RETRY_MS}\n\n"
+        if last_event_id:
+            missed = _replay_since(user_id, last_event_id)
+            if missed is None:
+                yield format_sse(Event(type="resync", data={}))
+            else:
+                for event in missed:
+                    yield format_sse(event)
+        deadline = time.monotonic() + settings.EVENTS_MAX_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=settings.EVENTS_HEARTBEAT_SECONDS)
+                yield format_sse(event)
+                # 禁用/删除后 token 已失效，推送后即关闭
+                if event.type == "status" and event.data.get("status") != "active":
+                    break
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    break
+                yield ": ping\n\n"
+    finally:
+        _unsubscribe(user_id, item)
+
+
+# ----- 扫描器：跨 worker 变更与试用到期 -----
+def _load_states(user_ids: list) -> dict:
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(
+                User.id,
+                User.state_version,
+                User.status,
+                func.coalesce(Entitlement.plan, entitlements.FREE),
+                Entitlement.trial_end_ts,
+            )
+            .outerjoin(Entitlement, Entitlement.user_id == User.id)
+            .where(User.id.in_(user_ids))
+        ).all()
+        return {r[0]: (r[1] or 0, r[2], r[3], r[4]) for r in rows}
+    finally:
+        db.close()
+
+
+def _diff(user_id: str, before: tuple, after: Optional[tuple], since_ts: int, now_ts: int) -> None:
+    if after is None:
+        publish(user_id, "status", {"status": "deleted"})
+        return
+    version, status, plan, end_ts = after
+    if version != before[0]:
+        if status != before[1]:
+            publish(user_id, "status", {"status": status})
+        if plan != before[2]:
+            publish(user_id, "plan", {"plan": plan})
+        if end_ts != before[3] and end_ts is not None:
+            publish(user_id, "trial", {"trialEndsAt": end_ts, "isActive": end_ts > now_ts})
+    if end_ts is not None and since_ts < end_ts <= now_ts:
+        publish(user_id, "trial", {"trialEndsAt": end_ts, "isActive": False})
+
+
+async def scan_once(since_ts: int, now_ts: int) -> None:
+    with _lock:
+        known = dict(_known)
+    user_ids = list(known)
+    for i in range(0, len(user_ids), 500):
+        chunk = user_ids[i:i + 500]
+        states = await run_in_threadpool(_load_states, chunk)
+        for user_id in chunk:
+            after = states.get(user_id)
+            _diff(user_id, known[user_id], after, since_ts, now_ts)
+            with _lock:
+                if user_id in _known and after is not None:
+                    _known[user_id] = after
+
+
+async def run_scanner() -> None:
+    since_ts = int(time.time())
+    while True:
+        await asyncio.sleep(settings.EVENTS_SCAN_SECONDS)
+        now_ts = int(time.time())
+        try:
+            await scan_once(since_ts, now_ts)
+            since_ts = now_ts
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("events scan failed")
@@ -0,0 +1,71 @@
+"""离线批量导入用户（迁移旧系统账号），不经过 HTTP。在 auth-api 目录执行：
+  python import_users.py users.ndjson
+  python import_users.py users.csv.gz --format csv --workers 8
+  cat users.ndjson | python import_users.py -
+记录格式与 POST /admin/users:import 相同（见 user_import）；.gz 文件自动解压。
+明文密码在本进程的 ProcessPoolExecutor 中 hash，已有 bcrypt hash 的记录直接写入；结束时打印统计 JSON。
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# 保证从 auth-api 目录加载
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+import search_index
+import user_import
+from database import SessionLocal, create_tables
+from password_hasher import bcrypt_hash
+
+
+def _open(path: str):
+    if path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", errors="replace")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="批量导入用户（NDJSON / CSV）")
+    ap.add_argument("path", help="输入文件，- 为标准输入")
+    ap.add_argument("--format", choices=("ndjson", "csv"), help="默认按扩展名判断，否则 ndjson")
+    ap.add_argument("--batch-size", type=int, default=user_import.BATCH_SIZE)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="明文密码 hash 进程数")
+    args = ap.parse_args()
+    fmt = args.format or ("csv" if args.path.removesuffix(".gz").endswith(".csv") else "ndjson")
+
+    create_tables()
+    search_index.init()
+    stats = user_import.ImportStats()
+    started = time.monotonic()
+    db = SessionLocal()
+    try:
+        with _open(args.path) as f, ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            for batch in user_import.read_batches(f, fmt, stats, max(1, args.batch_size)):
+                new, skipped = user_import.filter_new(db, batch)
+                stats.skipped_existing += skipped
+                plain = [r for r in new if r["password_hash"] is None]
+                for rec, hashed in zip(plain, pool.map(bcrypt_hash, [r["password"] for r in plain], chunksize=16)):
+                    rec["password_hash"], rec["password"] = hashed, None
+                imported, skipped = user_import.insert_batch(db, new)
+                stats.imported += imported
+                stats.skipped_existing += skipped
+                print(
+                    f"processed={stats.total} imported={stats.imported} skipped={stats.skipped_existing} "
+                    f"invalid={stats.invalid} elapsed={time.monotonic() - started:.1f}s",
+                    file=sys.stderr,
+                )
+    finally:
+        db.close()
+    print(json.dumps(stats.as_dict(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""已验证 JWT 的进程内缓存：sha256(token) -> claims。
+- 有效 token 缓存到其自身 exp，之后自然失效，不会比 JWT 本身活得更久
+- 无效 token（签名错误、已过期、格式错误）短暂负缓存 JWT_NEGATIVE_CACHE_SECONDS，挡住重复的坏请求
+缓存只省去签名校验；用户状态（禁用/删除）仍由调用方另行检查。
+stats() 返回命中/未命中与解码耗时（墙钟与 CPU），供 /health 与 /metrics 读取。
+"""
+import hashlib
+import threading
+import time
+from typing import Callable, Optional
+
+from jose import JWTError
+
+import metrics
+from cache import TTLCache
+from config import settings
+
+_INVALID = False
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.decode_seconds = 0.0
+        self.decode_cpu_seconds = 0.0
+
+    def record_decode(self, wall: float, cpu: float) -> None:
+        with self._lock:
+            self.misses += 1
+            self.decode_seconds += wall
+            self.decode_cpu_seconds += cpu
+
+    def record_hit(self, negative: bool) -> None:
+        with self._lock:
+            if negative:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+
+
+_stats = _Stats()
+_caches: list = []
+
+
+class DecodeCache:
+    """某一类 token（access / admin）的缓存；max_ttl 取该类 token 的最长有效期。"""
+
+    def __init__(self, name: str, max_ttl: float):
+        self.name = name
+        self._cache = TTLCache(maxsize=settings.JWT_CACHE_MAX_SIZE, ttl=max_ttl)
+        _caches.append(self)
+
+    def decode(self, token: str, verify: Callable[[str], dict]) -> Optional[dict]:
+        """返回已验证的 claims（只读，勿修改）；无效返回 None。verify 做完整校验，失败抛 JWTError。"""
+        key = hashlib.sha256(token.encode()).digest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            _stats.record_hit(cached is _INVALID)
+            return cached or None
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            payload = verify(token)
+        except JWTError:
+            payload = None
+        wall = time.perf_counter() - wall
+        _stats.record_decode(wall, time.thread_time() - cpu)
+        metrics.JWT_DECODE_SECONDS.observe(wall)
+        if payload is None:
+            self._cache.set(key, _INVALID, ttl=settings.JWT_NEGATIVE_CACHE_SECONDS)
+            return None
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            self._cache.set(key, payload, ttl=exp - time.time())
+        return payload
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+def stats() -> dict:
+    with _stats._lock:
+        return {
+            "hits": _stats.hits,
+            "negative_hits": _stats.negative_hits,
+            "misses": _stats.misses,
+            "decode_seconds_total": round(_stats.decode_seconds, 6),
+            "decode_cpu_seconds_total": round(_stats.decode_cpu_seconds, 6),
+            "entries": {c.name: len(c) for c in _caches},
+        }
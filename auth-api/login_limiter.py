@@ -0,0 +1,146 @@
+"""/login 准入控制：按账号（identifier）与客户端 IP 的滑动窗口限流，在 bcrypt 校验之前拒绝撞库流量。
+滑动窗口计数：当前窗口计数 + 上一窗口计数 × 未过去的比例，每个 key 每窗口一行。
+状态存放在本机 SQLite 文件（LOGIN_LIMIT_DB_PATH，WAL），同一台机器上的多个 uvicorn worker 共享；
+路径为空或无法打开时退化为进程内计数（仅单 worker 准确）。后端出错时放行并记日志，不影响正常登录。
+"""
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_rejected = metrics.Counter("login_rate_limited_total", "Login attempts rejected by the rate limiter", ("scope",))
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS login_attempts("
+    "key TEXT NOT NULL, window_start INTEGER NOT NULL, count INTEGER NOT NULL, "
+    "PRIMARY KEY (key, window_start)) WITHOUT ROWID"
+)
+_CLEANUP_EVERY = 1000
+
+_local = threading.local()
+_mem: dict = {}
+_mem_lock = threading.Lock()
+_calls = 0
+_use_sqlite = bool(settings.LOGIN_LIMIT_DB_PATH.strip())
+
+
+def _conn() -> Optional[sqlite3.Connection]:
+    """每线程一个连接（sqlite3 连接不跨线程共享）。"""
+    global _use_sqlite
+    conn = getattr(_local, "conn", None)
+    if conn is not None or not _use_sqlite:
+        return conn
+    path = settings.LOGIN_LIMIT_DB_PATH.strip()
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, timeout=2.0, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(_SCHEMA)
+    except Exception:
+        logger.warning("login limiter store %s unavailable, falling back to per-process counters", path, exc_info=True)
+        _use_sqlite = False
+        return None
+    _local.conn = conn
+    return conn
+
+
+def _estimate(prev: int, cur: int, weight: float) -> float:
+    return prev * weight + cur
+
+
+def _retry_after(prev: int, cur: int, limit: int, window: int, elapsed: float) -> int:
+    """估计值回落到 limit 以下还需的秒数：当前窗口已满则等到下一窗口，否则等上一窗口的权重衰减。"""
+    if cur >= limit or prev <= 0:
+        wait = window - elapsed
+    else:
+        wait = window * (1 - (limit - 1 - cur) / prev) - elapsed
+    return max(1, math.ceil(wait))
+
+
+def _check_sqlite(conn: sqlite3.Connection, keys: list, window: int, cur_start: int, weight: float, elapsed: float):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for key, limit, scope in keys:
+            rows = dict(
+                conn.execute(
+                    "SELECT window_start, count FROM login_attempts WHERE key = ? AND window_start IN (?, ?)",
+                    (key, cur_start - window, cur_start),
+                ).fetchall()
+            )
+            prev, cur = rows.get(cur_start - window, 0), rows.get(cur_start, 0)
+            if _estimate(prev, cur, weight) + 1 > limit:
+                conn.execute("ROLLBACK")
+                return scope, _retry_after(prev, cur, limit, window, elapsed)
+        conn.executemany(
+            "INSERT INTO login_attempts(key, window_start, count) VALUES (?, ?, 1) "
+            "ON CONFLICT(key, window_start) DO UPDATE SET count = count + 1",
+            [(key, cur_start) for key, _, _ in keys],
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return None
+
+
+def _check_memory(keys: list, window: int, cur_start: int, weight: float, elapsed: float):
+    with _mem_lock:
+        for key, limit, scope in keys:
+            prev = _mem.get((key, cur_start - window), 0)
+            cur = _mem.get((key, cur_start), 0)
+            if _estimate(prev, cur, weight) + 1 > limit:
+                return scope, _retry_after(prev, cur, limit, window, elapsed)
+        for key, _, _ in keys:
+            _mem[(key, cur_start)] = _mem.get((key, cur_start), 0) + 1
+    return None
+
+
+def _cleanup(conn: Optional[sqlite3.Connection], before: int) -> None:
+    if conn is not None:
+        conn.execute("DELETE FROM login_attempts WHERE window_start < ?", (before,))
+        return
+    with _mem_lock:
+        for k in [k for k in _mem if k[1] < before]:
+            del _mem[k]
+
+
+def check(identifier: str, client_ip: Optional[str]) -> Optional[tuple]:
+    """记一次登录尝试；超限时不计数，返回 (scope, retry_after_seconds)，scope 为 identifier 或 ip；放行返回 None。
+    同步函数（SQLite I/O），async 路由中经线程池调用。"""
+    global _calls
+    window = max(1, settings.LOGIN_LIMIT_WINDOW_SECONDS)
+    keys = []
+    if settings.LOGIN_LIMIT_PER_IDENTIFIER > 0 and identifier:
+        keys.append(("id:" + identifier.lower(), settings.LOGIN_LIMIT_PER_IDENTIFIER, "identifier"))
+    if settings.LOGIN_LIMIT_PER_IP > 0 and client_ip:
+        keys.append(("ip:" + client_ip, settings.LOGIN_LIMIT_PER_IP, "ip"))
+    if not keys:
+        return None
+    now = time.time()
+    cur_start = int(now // window) * window
+    elapsed = now - cur_start
+    weight = 1 - elapsed / window
+    try:
+        conn = _conn()
+        if conn is not None:
+            result = _check_sqlite(conn, keys, window, cur_start, weight, elapsed)
+        else:
+            result = _check_memory(keys, window, cur_start, weight, elapsed)
+        _calls += 1
+        if _calls % _CLEANUP_EVERY == 0:
+            _cleanup(conn, cur_start - window)
+    except Exception:
+        logger.warning("login limiter check failed, allowing attempt", exc_info=True)
+        return None
+    if result is not None:
+        _rejected.inc(result[0])
+    return result
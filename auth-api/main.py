@@ -1,21 +1,44 @@
 """Auth API 入口：FastAPI + CORS，挂载 /auth、/me、/admin"""
+import time
 import uuid
 from contextlib import asynccontextmanager
+
+import anyio.to_thread
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
+import audit
+import jwt_cache
+import maintenance
+import metrics
+import password_hasher
+import search_index
+import signing_keys
+import token_epochs
 from config import settings
-from database import create_tables
+from database import create_tables, dispose_engines
+from deps import err_server_busy
 from routers import admin, auth, me, subscription
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_tables()
+    token_epochs.init()
+    search_index.init()
+    password_hasher.start()
+    audit.start()
+    tasks = maintenance.start_background_tasks()
     yield
+    await maintenance.stop_background_tasks(tasks)
+    password_hasher.shutdown()
+    audit.stop()
+    await dispose_engines()
 
 
 class RequestIdMiddleware(BaseHTTPMiddleware):
@@ -24,15 +47,33 @@ class RequestIdMiddleware(BaseHTTPMiddleware):
         return await call_next(request)
 
 
+class MetricsMiddleware(BaseHTTPMiddleware):
+    """按路由模板与状态码记录请求数与延迟（到响应头发出为止，SSE 等流式响应不计流时长）。"""
+
+    async def dispatch(self, request: Request, call_next):
+        started = time.perf_counter()
+        status_code = "500"
+        try:
+            response = await call_next(request)
+            status_code = str(response.status_code)
+            return response
+        finally:
+            labels = (request.method, metrics.route_label(request.scope), status_code)
+            metrics.HTTP_REQUESTS.inc(*labels)
+            metrics.HTTP_LATENCY.observe(time.perf_counter() - started, *labels)
+
+
 app = FastAPI(title="Auth API", lifespan=lifespan)
 
 app.add_middleware(RequestIdMiddleware)
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.CORS_ORIGINS.split(",") if "," in settings.CORS_ORIGINS else [settings.CORS_ORIGINS],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],
 )
 
 app.include_router(auth.router)
@@ -41,6 +82,53 @@ app.include_router(admin.router)
 app.include_router(subscription.router)
 
 
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    """连接池等待超时（如 SQLite 单写连接被长事务占用）：返回 503 让客户端稍后重试，而不是 500。"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": err_server_busy()},
+        headers={"Retry-After": "2"},
+    )
+
+
+@app.get("/.well-known/jwks.json")
+def jwks(response: Response):
+    """access_token 验签公钥（JWT_ALGORITHM=ES256 时非空）；下游按 kid 缓存，遇到未知 kid 再刷新。"""
+    response.headers["Cache-Control"] = "public, max-age=300"
+    return signing_keys.jwks()
+
+
+def _runtime_metrics() -> list:
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    hasher_in_flight, hasher_capacity = password_hasher.occupancy()
+    jwt = jwt_cache.stats()
+    lines = (
+        metrics.gauge("threadpool_busy", "AnyIO default threadpool tokens in use", limiter.borrowed_tokens)
+        + metrics.gauge("threadpool_size", "AnyIO default threadpool size", limiter.total_tokens)
+        + metrics.gauge("bcrypt_in_flight", "bcrypt tasks running or queued", hasher_in_flight)
+        + metrics.gauge("bcrypt_capacity", "bcrypt workers + queue size", hasher_capacity)
+        + ["# HELP jwt_decode_cache_total JWT decode cache lookups", "# TYPE jwt_decode_cache_total counter"]
+    )
+    for result, key in (("hit", "hits"), ("negative_hit", "negative_hits"), ("miss", "misses")):
+        lines.append(f'jwt_decode_cache_total{{result="{result}"}} {jwt[key]}')
+    lines += [
+        "# HELP jwt_decode_cpu_seconds_total CPU time spent verifying JWT signatures",
+        "# TYPE jwt_decode_cpu_seconds_total counter",
+        f"jwt_decode_cpu_seconds_total {jwt['decode_cpu_seconds_total']}",
+    ]
+    return lines
+
+
+metrics.register_collector(_runtime_metrics)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Prometheus 文本格式；async 以便在事件循环中读取线程池占用。"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {"status": "ok", "jwt_decode": jwt_cache.stats()}
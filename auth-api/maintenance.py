@@ -0,0 +1,364 @@
+"""后台维护任务：定期清理 refresh_tokens 与过期 audit_log；启动 /auth/events 的变更扫描器与 token 纪元增量刷新。
+- 删除已过期或已吊销的行（按 expires_at 顺序、小批量）
+- 每个用户只保留最新 REFRESH_TOKENS_PER_USER 个未吊销 token
+每批一个短事务，批间 sleep，避免长时间占用 SQLite 写锁阻塞登录。
+"""
+import asyncio
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import Connection
+from starlette.concurrency import run_in_threadpool
+
+import events
+import token_epochs
+import token_store
+from config import settings
+from database import SessionLocal, engine
+from models import AuditLog, RefreshToken
+
+logger = logging.getLogger(__name__)
+
+# 最近一次清理结果，供监控读取
+last_run: dict = {}
+
+
+def _delete_batch(ids: list) -> int:
+    if not ids:
+        return 0
+    db = SessionLocal()
+    try:
+        n = db.query(RefreshToken).filter(RefreshToken.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        return n
+    finally:
+        db.close()
+
+
+def _expired_ids(now: datetime, limit: int) -> list:
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(RefreshToken.id)
+            .filter(RefreshToken.expires_at < now)
+            .order_by(RefreshToken.expires_at)
+            .limit(limit)
+            .all()
+        )
+        return [r[0] for r in rows]
+    finally:
+        db.close()
+
+
+def _revoked_ids(limit: int) -> list:
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(RefreshToken.id)
+            .filter(RefreshToken.revoked_at.isnot(None))
+            .order_by(RefreshToken.expires_at)
+            .limit(limit)
+            .all()
+        )
+        return [r[0] for r in rows]
+    finally:
+        db.close()
+
+
+def _users_over_limit(keep: int, limit: int) -> list:
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(RefreshToken.user_id)
+            .filter(RefreshToken.revoked_at.is_(None))
+            .group_by(RefreshToken.user_id)
+            .having(func.count(RefreshToken.id) > keep)
+            .limit(limit)
+            .all()
+        )
+        return [r[0] for r in rows]
+    finally:
+        db.close()
+
+
+def _surplus_tokens(user_id: str, keep: int, limit: int) -> list:
+    """用户未吊销 token 中，最新 keep 个之外的 (id, token_hash)。"""
+    db = SessionLocal()
+    try:
+        return (
+            db.query(RefreshToken.id, RefreshToken.token_hash)
+            .filter(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+            .order_by(RefreshToken.created_at.desc(), RefreshToken.id.desc())
+            .offset(keep)
+            .limit(limit)
+            .all()
+        )
+    finally:
+        db.close()
+
+
+async def _drain(fetch, batch_size: int, pause: float) -> int:
+    """循环 fetch 一批 id 并删除，直到取空；每批之间 sleep 让出写锁。"""
+    total = 0
+    while True:
+        ids = await run_in_threadpool(fetch, batch_size)
+        if not ids:
+            return total
+        total += await run_in_threadpool(_delete_batch, ids)
+        if len(ids) < batch_size:
+            return total
+        await asyncio.sleep(pause)
+
+
+async def sweep_refresh_tokens() -> dict:
+    """执行一轮清理，返回各类删除行数。"""
+    started = time.monotonic()
+    batch_size = max(1, settings.REFRESH_SWEEP_BATCH_SIZE)
+    pause = max(0.0, settings.REFRESH_SWEEP_BATCH_PAUSE_SECONDS)
+    now = datetime.utcnow()
+
+    expired = await _drain(lambda n: _expired_ids(now, n), batch_size, pause)
+    revoked = await _drain(_revoked_ids, batch_size, pause)
+
+    trimmed = 0
+    keep = settings.REFRESH_TOKENS_PER_USER
+    if keep > 0:
+        while True:
+            user_ids = await run_in_threadpool(_users_over_limit, keep, batch_size)
+            for user_id in user_ids:
+                while True:
+                    rows = await run_in_threadpool(_surplus_tokens, user_id, keep, batch_size)
+                    if not rows:
+                        break
+                    trimmed += await run_in_threadpool(_delete_batch, [r[0] for r in rows])
+                    for _, hashed in rows:
+                        token_store.discard(hashed)
+                    await asyncio.sleep(pause)
+            if len(user_ids) < batch_size:
+                break
+
+    result = {
+        "expired": expired,
+        "revoked": revoked,
+        "trimmed": trimmed,
+        "elapsed_seconds": round(time.monotonic() - started, 3),
+        "finished_at": datetime.utcnow().isoformat(),
+    }
+    last_run.clear()
+    last_run.update(result)
+    logger.info(
+        "[TOKEN-SWEEP] purged expired=%d revoked=%d trimmed=%d elapsed=%.2fs",
+        expired, revoked, trimmed, result["elapsed_seconds"],
+    )
+    return result
+
+
+async def run_refresh_token_sweeper() -> None:
+    """lifespan 中启动的常驻任务：每 REFRESH_SWEEP_INTERVAL_SECONDS 清理一轮。"""
+    interval = settings.REFRESH_SWEEP_INTERVAL_SECONDS
+    while True:
+        # 先等待再清理：避开启动阶段（多 worker 同时冷启动）
+        await asyncio.sleep(interval)
+        try:
+            await sweep_refresh_tokens()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("[TOKEN-SWEEP] failed")
+
+
+# ----- audit_log 保留期清理 -----
+# MySQL：audit_log 按月 RANGE 分区（p<YYYYMM> + pmax），过期分区整块 DROP，并预建未来分区。
+# 分区要求主键包含分区列，因此主键改为 (id, ts)；转换由 schema 迁移步骤 partition_audit_log 执行一次，
+# 定期任务只预建未来分区、删除过期分区（命名锁保护，多个 worker 不会同时改分区）。
+# 其他后端（SQLite）：ts 与自增 id 同序，按 id 区间分批 DELETE（每批是 rowid B-tree 上的一段连续范围）。
+_AUDIT_FUTURE_MONTHS = 2
+_AUDIT_DELETE_WINDOW = 50000
+
+
+def _month_start(d: date, offset: int = 0) -> date:
+    m = d.year * 12 + d.month - 1 + offset
+    return date(m // 12, m % 12 + 1, 1)
+
+
+def _partition_def(upper: date) -> str:
+    lower = _month_start(upper, -1)
+    return f"PARTITION p{lower:%Y%m} VALUES LESS THAN (TO_DAYS('{upper.isoformat()}'))"
+
+
+def _audit_partitions(conn) -> dict:
+    """分区名 -> 上界（date；pmax 为 None）；未分区返回空字典。"""
+    rows = conn.execute(
+        text(
+            "SELECT partition_name, partition_description FROM information_schema.partitions "
+            "WHERE table_schema = DATABASE() AND table_name = 'audit_log' AND partition_name IS NOT NULL"
+        )
+    ).all()
+    out = {}
+    for name, description in rows:
+        if name == "pmax":
+            out[name] = None
+        else:
+            out[name] = _month_start(datetime.strptime(name[1:], "%Y%m").date(), 1)
+    return out
+
+
+_AUDIT_PARTITION_LOCK = "auth_api_audit_partitions"
+
+
+def partition_audit_log(conn: Connection) -> None:
+    """迁移步骤（仅 MySQL）：audit_log 改为按月 RANGE 分区，首个分区覆盖现有最早记录所在月份。
+    已有数据时 MySQL 会重建整表，只在升级时执行一次。"""
+    if conn.dialect.name != "mysql" or _audit_partitions(conn):
+        return
+    today = datetime.utcnow().date()
+    oldest = conn.execute(select(func.min(AuditLog.ts))).scalar()
+    first = _month_start(min(oldest.date(), today) if oldest else today, 1)
+    uppers = [first]
+    while uppers[-1] < _month_start(today, _AUDIT_FUTURE_MONTHS + 1):
+        uppers.append(_month_start(uppers[-1], 1))
+    conn.execute(text("ALTER TABLE audit_log DROP PRIMARY KEY, ADD PRIMARY KEY (id, ts)"))
+    conn.execute(
+        text(
+            "ALTER TABLE audit_log PARTITION BY RANGE (TO_DAYS(ts)) ("
+            + ", ".join(_partition_def(u) for u in uppers)
+            + ", PARTITION pmax VALUES LESS THAN MAXVALUE)"
+        )
+    )
+
+
+def prepare_audit_partitions() -> bool:
+    """MySQL：预建未来 _AUDIT_FUTURE_MONTHS 个月的分区；返回是否处于分区模式（未分区时走区间删除）。
+    其他 worker 正在改分区时跳过本轮预建。"""
+    if engine.dialect.name != "mysql":
+        return False
+    today = datetime.utcnow().date()
+    with engine.begin() as conn:
+        parts = _audit_partitions(conn)
+        if not parts:
+            return False
+        if conn.execute(text("SELECT GET_LOCK(:name, 0)"), {"name": _AUDIT_PARTITION_LOCK}).scalar() != 1:
+            return True
+        try:
+            parts = _audit_partitions(conn)
+            last = max(u for u in parts.values() if u is not None)
+            wanted = _month_start(today, _AUDIT_FUTURE_MONTHS + 1)
+            new = []
+            while last < wanted:
+                last = _month_start(last, 1)
+                new.append(last)
+            if new:
+                conn.execute(
+                    text(
+                        "ALTER TABLE audit_log REORGANIZE PARTITION pmax INTO ("
+                        + ", ".join(_partition_def(u) for u in new)
+                        + ", PARTITION pmax VALUES LESS THAN MAXVALUE)"
+                    )
+                )
+        finally:
+            conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": _AUDIT_PARTITION_LOCK})
+    return True
+
+
+def _drop_audit_partitions(cutoff: datetime) -> int:
+    """删除上界不晚于 cutoff 的整月分区，返回分区数；其他 worker 正在改分区时跳过。"""
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT GET_LOCK(:name, 0)"), {"name": _AUDIT_PARTITION_LOCK}).scalar() != 1:
+            return 0
+        try:
+            old = [n for n, upper in _audit_partitions(conn).items() if upper is not None and upper <= cutoff.date()]
+            if old:
+                conn.execute(text("ALTER TABLE audit_log DROP PARTITION " + ", ".join(old)))
+        finally:
+            conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": _AUDIT_PARTITION_LOCK})
+    return len(old)
+
+
+def _audit_id_range(cutoff: datetime) -> tuple:
+    db = SessionLocal()
+    try:
+        hi = db.query(func.max(AuditLog.id)).filter(AuditLog.ts < cutoff).scalar()
+        lo = db.query(func.min(AuditLog.id)).scalar()
+        return lo, hi
+    finally:
+        db.close()
+
+
+def _delete_audit_window(lo: int, hi: int, cutoff: datetime) -> int:
+    db = SessionLocal()
+    try:
+        n = (
+            db.query(AuditLog)
+            .filter(AuditLog.id >= lo, AuditLog.id < hi, AuditLog.ts < cutoff)
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        return n
+    finally:
+        db.close()
+
+
+async def purge_audit_log() -> dict:
+    """执行一轮 audit_log 保留期清理。"""
+    started = time.monotonic()
+    cutoff = datetime.utcnow() - timedelta(days=settings.AUDIT_RETENTION_DAYS)
+    result = {"partitions_dropped": 0, "rows_deleted": 0}
+    if await run_in_threadpool(prepare_audit_partitions):
+        # 分区按月划分：cutoff 所在月的记录等到整月过期后随分区一起删除
+        result["partitions_dropped"] = await run_in_threadpool(_drop_audit_partitions, cutoff)
+    else:
+        lo, hi = await run_in_threadpool(_audit_id_range, cutoff)
+        if lo is not None and hi is not None:
+            pause = max(0.0, settings.REFRESH_SWEEP_BATCH_PAUSE_SECONDS)
+            for start in range(lo, hi + 1, _AUDIT_DELETE_WINDOW):
+                end = min(start + _AUDIT_DELETE_WINDOW, hi + 1)
+                result["rows_deleted"] += await run_in_threadpool(_delete_audit_window, start, end, cutoff)
+                await asyncio.sleep(pause)
+    result["elapsed_seconds"] = round(time.monotonic() - started, 3)
+    logger.info(
+        "[AUDIT-RETENTION] partitions_dropped=%d rows_deleted=%d elapsed=%.2fs",
+        result["partitions_dropped"], result["rows_deleted"], result["elapsed_seconds"],
+    )
+    return result
+
+
+async def run_audit_retention() -> None:
+    """常驻任务：启动时准备分区，之后每 AUDIT_RETENTION_INTERVAL_SECONDS 清理一轮。"""
+    try:
+        await run_in_threadpool(prepare_audit_partitions)
+    except Exception:
+        logger.exception("[AUDIT-RETENTION] partition setup failed")
+    while True:
+        await asyncio.sleep(settings.AUDIT_RETENTION_INTERVAL_SECONDS)
+        try:
+            await purge_audit_log()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("[AUDIT-RETENTION] failed")
+
+
+def start_background_tasks() -> list:
+    tasks = []
+    if settings.REFRESH_SWEEP_INTERVAL_SECONDS > 0:
+        tasks.append(asyncio.create_task(run_refresh_token_sweeper()))
+    if settings.AUDIT_RETENTION_DAYS > 0 and settings.AUDIT_RETENTION_INTERVAL_SECONDS > 0:
+        tasks.append(asyncio.create_task(run_audit_retention()))
+    if settings.EVENTS_SCAN_SECONDS > 0:
+        tasks.append(asyncio.create_task(events.run_scanner()))
+    if settings.TOKEN_EPOCH_REFRESH_SECONDS > 0:
+        tasks.append(asyncio.create_task(token_epochs.run_refresher()))
+    return tasks
+
+
+async def stop_background_tasks(tasks: Optional[list]) -> None:
+    for task in tasks or []:
+        task.cancel()
+    for task in tasks or []:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
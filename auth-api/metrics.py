@@ -0,0 +1,135 @@
+"""Prometheus 文本格式指标（GET /metrics），进程内计数，不依赖 prometheus_client。
+- http_requests_total / http_request_duration_seconds：按路由模板、方法、状态码
+- db_pool_*：database.engine 连接池（checked out / overflow / size / checkout 次数）
+- threadpool_*：AnyIO 默认线程池占用
+- bcrypt_seconds：password_hasher 的 hash/verify 耗时；jwt_decode_*：jwt_cache 解码耗时与命中
+多 worker 部署时每个进程各自计数，抓取时带上实例标识或逐个 worker 抓取。
+"""
+import threading
+from typing import Callable, Iterable, Optional
+
+_DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: list = []
+_collectors: list = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labelnames: tuple = ()):
+        self.name, self.doc, self.labelnames = name, doc, labelnames
+        self._values: dict = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_fmt(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labelnames: tuple = (), buckets: tuple = _DEFAULT_BUCKETS):
+        self.name, self.doc, self.labelnames = name, doc, labelnames
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # labels -> [bucket counts..., sum, count]
+        self._values: dict = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = [(labels, list(row)) for labels, row in self._values.items()]
+        for labels, row in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, row):
+                cumulative += n
+                le = f'le="{_fmt(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_fmt(row[-2])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {row[-1]}"
+
+
+def gauge(name: str, doc: str, value: float, labelnames: tuple = (), labels: tuple = ()) -> list:
+    return [
+        f"# HELP {name} {doc}",
+        f"# TYPE {name} gauge",
+        f"{name}{_labels(labelnames, labels)} {_fmt(value)}",
+    ]
+
+
+def register_collector(fn: Callable[[], Iterable[str]]) -> None:
+    """注册抓取时才计算的指标（连接池、线程池等瞬时值）。"""
+    _collectors.append(fn)
+
+
+def render() -> str:
+    lines: list = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for fn in _collectors:
+        lines.extend(fn())
+    return "\n".join(lines) + "\n"
+
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template and status code", ("method", "route", "status")
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP latency until response start, by route template and status code",
+    ("method", "route", "status"),
+)
+BCRYPT_SECONDS = Histogram(
+    "bcrypt_seconds", "bcrypt hash/verify wall time including pool queueing", ("op",),
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0),
+)
+BCRYPT_REJECTED = Counter("bcrypt_rejected_total", "bcrypt tasks rejected because the queue was full")
+JWT_DECODE_SECONDS = Histogram(
+    "jwt_decode_seconds", "JWT signature verification time on cache miss",
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01),
+)
+
+
+def route_label(scope: dict) -> str:
+    """路由模板（如 /admin/users/{username}）；未匹配路由统一记为 <unmatched>，避免标签爆炸。"""
+    route = scope.get("route")
+    path: Optional[str] = getattr(route, "path", None)
+    return path or "<unmatched>"
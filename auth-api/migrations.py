@@ -0,0 +1,171 @@
+"""有序的版本化 schema 迁移：schema_version 表记录已执行的步骤，每步只执行一次（SQLite / MySQL 通用）。
+启动时先读一次 MAX(version)：已是最新则直接返回，不做表结构探测、不加写锁。
+需要升级时先取得独占锁再复查版本，多个 worker 同时启动只有一个执行迁移：
+- SQLite：BEGIN IMMEDIATE，全部步骤在一个事务内（SQLite 的 DDL 可回滚，升级要么全部生效要么不生效）
+- MySQL：GET_LOCK 命名锁；DDL 会隐式提交，每步执行完即记录版本，中断后从下一步继续
+新增表结构变更时在 MIGRATIONS 末尾追加一步（版本号递增，已发布的步骤不要修改）；
+步骤应可在“列/索引已存在”的库上安全执行，以兼容引入本模块之前由 create_all 建出的库。
+"""
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+import entitlements
+import maintenance
+import search_index
+from models import Base
+
+logger = logging.getLogger(__name__)
+
+_LOCK_NAME = "auth_api_schema_migrations"
+_LOCK_TIMEOUT_SECONDS = 300
+
+_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    _metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+# ----- 迁移步骤 -----
+def _initial_schema(conn: Connection) -> None:
+    """按当前模型建出缺失的表（新库在这一步即得到完整结构，后续步骤均为空操作）。"""
+    Base.metadata.create_all(bind=conn)
+
+
+def _users_legacy_columns(conn: Connection) -> None:
+    """SQLite 早期库：为 users 补 created_at/status/plan/trial_* 列，并对老数据补 created_at、status。"""
+    if conn.dialect.name != "sqlite":
+        return
+    columns = {row[1] for row in conn.execute(text("PRAGMA table_info(users)")).fetchall()}
+    if "created_at" not in columns:
+        conn.execute(text("ALTER TABLE users ADD COLUMN created_at TEXT"))
+    if "status" not in columns:
+        conn.execute(text("ALTER TABLE users ADD COLUMN status TEXT DEFAULT 'active'"))
+    if "plan" not in columns:
+        conn.execute(text("ALTER TABLE users ADD COLUMN plan TEXT DEFAULT 'free'"))
+    if "trial_start_at" not in columns:
+        conn.execute(text("ALTER TABLE users ADD COLUMN trial_start_at TEXT"))
+    if "trial_end_at" not in columns:
+        conn.execute(text("ALTER TABLE users ADD COLUMN trial_end_at TEXT"))
+    conn.execute(text("UPDATE users SET status = 'active' WHERE status IS NULL OR status = ''"))
+    conn.execute(text("UPDATE users SET created_at = datetime('now') WHERE created_at IS NULL OR created_at = ''"))
+
+
+def _add_columns(*columns: tuple) -> Callable[[Connection], None]:
+    """补列步骤：columns 为 (表, 列, DDL 类型与默认值)，列已存在则跳过。"""
+
+    def step(conn: Connection) -> None:
+        existing = {}
+        for table, column, ddl in columns:
+            if table not in existing:
+                existing[table] = {c["name"] for c in inspect(conn).get_columns(table)}
+            if column not in existing[table]:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+    return step
+
+
+def _model_indexes(conn: Connection) -> None:
+    """create_all 不会给已存在的表补索引：按模型逐个 checkfirst 创建。"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
+# (版本, 名称, 步骤)；按版本升序执行
+MIGRATIONS = [
+    (1, "initial_schema", _initial_schema),
+    (2, "users_legacy_columns", _users_legacy_columns),
+    (3, "users_state_version", _add_columns(("users", "state_version", "INTEGER NOT NULL DEFAULT 0"))),
+    (4, "entitlements_version", _add_columns(("entitlements", "version", "INTEGER NOT NULL DEFAULT 0"))),
+    (
+        5,
+        "users_token_epoch",
+        _add_columns(
+            ("users", "token_epoch", "INTEGER NOT NULL DEFAULT 0"),
+            ("users", "token_epoch_at", "DATETIME NULL"),
+        ),
+    ),
+    (6, "model_indexes", _model_indexes),
+    (7, "entitlements_backfill", entitlements.backfill),
+    (8, "user_search_index", search_index.migrate),
+    (9, "audit_log_partitions", maintenance.partition_audit_log),
+    (10, "user_search_rowids", search_index.rekey),
+]
+LATEST = MIGRATIONS[-1][0]
+
+
+# ----- 执行器 -----
+def _current_version(conn: Connection) -> int:
+    try:
+        return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        # schema_version 尚不存在
+        conn.rollback()
+        return 0
+
+
+@contextmanager
+def _exclusive(conn: Connection):
+    """跨进程独占：SQLite 以 BEGIN IMMEDIATE 取得写锁（事务由调用方提交）；MySQL 用 GET_LOCK。"""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        deadline = time.monotonic() + _LOCK_TIMEOUT_SECONDS
+        while True:
+            try:
+                conn.exec_driver_sql("BEGIN IMMEDIATE")
+                break
+            except OperationalError:
+                conn.rollback()
+                if time.monotonic() > deadline:
+                    raise
+                logger.info("waiting for schema migration lock")
+        yield
+    elif dialect == "mysql":
+        got = conn.execute(text("SELECT GET_LOCK(:name, :timeout)"), {"name": _LOCK_NAME, "timeout": _LOCK_TIMEOUT_SECONDS}).scalar()
+        if got != 1:
+            raise RuntimeError("timed out waiting for schema migration lock")
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": _LOCK_NAME})
+    else:
+        yield
+
+
+def upgrade(engine: Engine) -> int:
+    """执行未应用的迁移步骤，返回当前版本；已是最新时只有一次版本查询。"""
+    with engine.connect() as conn:
+        current = _current_version(conn)
+        conn.rollback()
+        if current >= LATEST:
+            return current
+        sqlite = conn.dialect.name == "sqlite"
+        try:
+            with _exclusive(conn):
+                schema_version.create(bind=conn, checkfirst=True)
+                current = _current_version(conn)
+                for version, name, step in MIGRATIONS:
+                    if version <= current:
+                        continue
+                    logger.info("applying schema migration %d %s", version, name)
+                    step(conn)
+                    conn.execute(schema_version.insert().values(version=version, name=name, applied_at=datetime.utcnow()))
+                    if not sqlite:
+                        conn.commit()
+                    current = version
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return current
@@ -1,6 +1,6 @@
-"""数据表：users, refresh_tokens, subscriptions(预留)"""
+"""数据表：users, refresh_tokens, subscriptions(预留), entitlements, audit_log"""
 from datetime import datetime
-from sqlalchemy import Column, DateTime, ForeignKey, JSON, String
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Index, Integer, JSON, String, Text
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -16,22 +16,33 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     last_login_at = Column(DateTime, nullable=True)
     status = Column(String(20), default="active")  # active | disabled
-    plan = Column(String(32), default="free")  # free | trial | pro
+    plan = Column(String(32), default="free")  # 旧字段，权益以 entitlements.plan 为准
     trial_start_at = Column(DateTime, nullable=True)
     trial_end_at = Column(DateTime, nullable=True)
+    # 用户状态版本：登录、开通试用、套餐变更、禁用/启用时 +1，用于状态接口 ETag
+    state_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # token 纪元：禁用、重置密码、删除时 +1，te claim 小于它的 access_token 全部失效（见 token_epochs）
+    token_epoch = Column(Integer, nullable=False, default=0, server_default="0")
+    token_epoch_at = Column(DateTime, nullable=True)
 
     refresh_tokens = relationship("RefreshToken", back_populates="user")
     subscription = relationship("Subscription", back_populates="user", uselist=False)
 
+    # 管理端列表按 (created_at, id) 倒序做 keyset 分页；token_epoch_at 供纪元增量拉取
+    __table_args__ = (
+        Index("ix_users_created_at_id", "created_at", "id"),
+        Index("ix_users_token_epoch_at", "token_epoch_at"),
+    )
+
 
 class RefreshToken(Base):
     __tablename__ = "refresh_tokens"
 
     id = Column(String(36), primary_key=True, index=True)
-    user_id = Column(String(36), ForeignKey("users.id"), nullable=False)
+    user_id = Column(String(36), ForeignKey("users.id"), nullable=False, index=True)
     token_hash = Column(String(255), nullable=False, index=True)
-    expires_at = Column(DateTime, nullable=False)
-    revoked_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     user = relationship("User", back_populates="refresh_tokens")
@@ -48,3 +59,50 @@ class Subscription(Base):
     features_json = Column(JSON, nullable=True)  # 预留：["feature_a", "feature_b"]
 
     user = relationship("User", back_populates="subscription")
+
+
+class Entitlement(Base):
+    """用户权益：套餐、试用起止、订阅到期（unix 秒）。按 user_id 主键读取，
+    /auth/status、/auth/trial/*、/subscription/status 与管理端均以此为准（替代 SQLite 专用的 trials 表）。"""
+
+    __tablename__ = "entitlements"
+
+    user_id = Column(String(36), ForeignKey("users.id"), primary_key=True)
+    plan = Column(String(32), nullable=False, default="free", server_default="free")  # free | trial | pro ...
+    trial_start_ts = Column(Integer, nullable=True)
+    trial_end_ts = Column(Integer, nullable=True)
+    subscription_expires_ts = Column(Integer, nullable=True)  # 付费套餐到期；null 为不过期
+    # 权益版本：套餐/试用每次变更 +1，写入 access_token 的 ev claim，用于识别过期的权益 claims
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # 覆盖索引：状态读取只走索引，不回表
+    __table_args__ = (
+        Index(
+            "ix_entitlements_covering",
+            "user_id", "plan", "trial_start_ts", "trial_end_ts", "subscription_expires_ts", "version",
+        ),
+    )
+
+
+class AuditLog(Base):
+    """管理操作审计（AUDIT_SINK=db 时由 audit 模块批量写入）。"""
+
+    __tablename__ = "audit_log"
+
+    # SQLite 只有 INTEGER PRIMARY KEY 才自增
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    ts = Column(DateTime, nullable=False)
+    request_id = Column(String(36), nullable=True)
+    url = Column(String(1024), nullable=True)
+    action = Column(String(64), nullable=False)
+    target_user = Column(String(255), nullable=True)
+    status = Column(String(16), nullable=True)
+    response = Column(Text, nullable=True)
+
+    # GET /admin/audit 按 (ts, id) 倒序 keyset 分页；按用户 / 操作过滤各有一条组合索引
+    __table_args__ = (
+        Index("ix_audit_log_ts", "ts"),
+        Index("ix_audit_log_target_user_ts", "target_user", "ts"),
+        Index("ix_audit_log_action_ts", "action", "ts"),
+    )
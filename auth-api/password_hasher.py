@@ -0,0 +1,144 @@
+"""bcrypt 专用执行器：hash/verify 放到独立进程池执行，不占用 FastAPI 默认线程池。
+队列有界：在途任务（执行中 + 排队）超过上限时直接拒绝，由调用方返回 503。
+本模块只依赖 bcrypt、config 与 metrics，子进程导入成本低。
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+import bcrypt
+
+import metrics
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordHasherBusy(Exception):
+    """在途 hash 任务已达上限（workers + queue）。"""
+
+
+def bcrypt_hash(password: str) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+
+def bcrypt_verify(plain: str, hashed: str) -> bool:
+    return bcrypt.checkpw(plain.encode("utf-8"), hashed.encode("utf-8"))
+
+
+def _worker_count() -> int:
+    n = settings.PASSWORD_HASH_WORKERS
+    if n < 0:
+        return 0
+    return n or min(4, os.cpu_count() or 1)
+
+
+_lock = threading.Lock()
+_executor: Optional[ProcessPoolExecutor] = None
+_capacity = max(1, _worker_count() + settings.PASSWORD_HASH_QUEUE_SIZE)
+_slots = threading.BoundedSemaphore(_capacity)
+_in_flight = 0
+
+
+def _get_executor() -> Optional[ProcessPoolExecutor]:
+    """懒加载进程池；workers 配置为负数时返回 None（退化为线程内执行）。"""
+    global _executor
+    workers = _worker_count()
+    if workers <= 0:
+        return None
+    with _lock:
+        if _executor is None:
+            # spawn：避免在已有事件循环/线程的父进程中 fork
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _reset_executor(broken: ProcessPoolExecutor) -> None:
+    global _executor
+    with _lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def _submit(fn: Callable[..., Any], *args: Any, limit: Optional[int] = None) -> Any:
+    global _in_flight
+    if limit is not None and _in_flight >= limit:
+        metrics.BCRYPT_REJECTED.inc()
+        raise PasswordHasherBusy()
+    if not _slots.acquire(blocking=False):
+        metrics.BCRYPT_REJECTED.inc()
+        raise PasswordHasherBusy()
+    _in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        executor = _get_executor()
+        if executor is None:
+            return await loop.run_in_executor(None, fn, *args)
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            # 子进程异常退出：重建进程池后重试一次
+            logger.warning("password hasher pool broken, recreating")
+            _reset_executor(executor)
+            return await loop.run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _in_flight -= 1
+        _slots.release()
+
+
+async def hash_password(password: str) -> str:
+    started = time.perf_counter()
+    try:
+        return await _submit(bcrypt_hash, password)
+    finally:
+        metrics.BCRYPT_SECONDS.observe(time.perf_counter() - started, "hash")
+
+
+async def verify_password(plain: str, hashed: str, limit: Optional[int] = None) -> bool:
+    """limit：调用方可用的在途任务上限（低于全局容量），如登录为其他 hash 调用预留余量。"""
+    started = time.perf_counter()
+    try:
+        return await _submit(bcrypt_verify, plain, hashed, limit=limit)
+    finally:
+        metrics.BCRYPT_SECONDS.observe(time.perf_counter() - started, "verify")
+
+
+def worker_count() -> int:
+    """批量任务（如用户导入）的 hash 并发度：进程池 worker 数，至少 1。"""
+    return max(1, _worker_count())
+
+
+def login_limit() -> int:
+    """登录可用的在途上限：LOGIN_MAX_IN_FLIGHT，0 时为 workers × 2（不超过全局容量）。"""
+    n = settings.LOGIN_MAX_IN_FLIGHT or max(1, _worker_count()) * 2
+    return min(n, _capacity)
+
+
+def occupancy() -> tuple:
+    """(在途任务数, 上限)：在途含执行中与排队中。"""
+    return _in_flight, _capacity
+
+
+def start() -> None:
+    """启动时预热进程池，避免首个登录请求承担进程创建开销。"""
+    executor = _get_executor()
+    if executor is not None:
+        executor.submit(int).result()
+
+
+def shutdown() -> None:
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
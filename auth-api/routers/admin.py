@@ -1,24 +1,45 @@
 """管理员接口：/admin/login 与 /admin/users/*，均需 admin token（除 login 外），并写审计日志"""
+import base64
+import csv
+import io
+import json
 import re
 import secrets
 import uuid
-from typing import Optional
+import zlib
+from datetime import datetime, timezone
+from typing import Iterator, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status
-from sqlalchemy import or_, text
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, func, or_, select, text, tuple_
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
+import entitlements
+import events
+import search_index
+import token_epochs
+import token_store
+import user_cache
+import user_import
+from cache import TTLCache
 from config import settings
-from database import get_db
+from database import SessionLocal, get_async_db, get_db
 from deps import (
     auth_audit_log,
     create_admin_token,
     get_current_admin,
-    hash_password,
+    hash_password_async,
 )
-from models import RefreshToken, Subscription, User
-from schemas import err_wrong_password
+from models import AuditLog, Entitlement, RefreshToken, Subscription, User
+from schemas import err_invalid_params, err_wrong_password
 from schemas_admin import (
+    AdminAuditItem,
+    AdminBulkBody,
+    AdminBulkItem,
+    AdminBulkResponse,
+    AdminImportResponse,
     AdminLoginBody,
     AdminLoginResponse,
     AdminResetPasswordBody,
@@ -54,20 +75,47 @@ def _username_of(user: User) -> str:
     return user.email or user.phone or user.id
 
 
-def _trial_end_ts(db: Session, user_id: str) -> Optional[int]:
-    row = db.execute(
-        text("SELECT end_ts FROM trials WHERE username = :u"),
-        {"u": user_id},
-    ).fetchone()
-    return int(row[0]) if row and row[0] is not None else None
+def _encode_cursor(created_at: Optional[datetime], user_id: str) -> str:
+    raw = json.dumps([created_at.isoformat() if created_at else None, user_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
 
 
-def _trial_start_ts(db: Session, user_id: str) -> Optional[int]:
-    row = db.execute(
-        text("SELECT start_ts FROM trials WHERE username = :u"),
-        {"u": user_id},
-    ).fetchone()
-    return int(row[0]) if row and row[0] is not None else None
+def _decode_cursor(cursor: str) -> tuple[Optional[datetime], str]:
+    """与 _encode_cursor 对称：时间为 null 的游标解出 None。"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, user_id = json.loads(raw)
+        return (datetime.fromisoformat(created_at) if created_at is not None else None), str(user_id)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=err_invalid_params("cursor 无效"),
+        )
+
+
+_total_cache = TTLCache(maxsize=1, ttl=60)
+
+
+def _approx_user_count(db: Session) -> int:
+    """近似总数：SQLite 取 MAX(rowid)（删除不回收），MySQL 取 information_schema 统计值；缓存 60 秒。"""
+    cached = _total_cache.get("users")
+    if cached is not None:
+        return cached
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        total = db.execute(text("SELECT MAX(rowid) FROM users")).scalar()
+    elif dialect == "mysql":
+        total = db.execute(
+            text(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'users'"
+            )
+        ).scalar()
+    else:
+        total = db.query(func.count(User.id)).scalar()
+    total = int(total or 0)
+    _total_cache.set("users", total)
+    return total
 
 
 # ----- POST /admin/login -----
@@ -99,45 +147,170 @@ def _req_id(request: Request) -> str:
 @router.get("/users", response_model=list[AdminUserListItem])
 def admin_list_users(
     request: Request,
+    response: Response,
     query: Optional[str] = None,
+    cursor: Optional[str] = None,
     page: int = 1,
     size: int = 20,
     admin: str = Depends(get_current_admin),
     db: Session = Depends(get_db),
 ):
+    """按 created_at 倒序列出用户（含 trial_end、plan，与 entitlements 一次 JOIN）。
+    分页：响应头 X-Next-Cursor 为下一页游标，带 cursor 请求即取下一页（keyset，不走 OFFSET）；
+    page 参数仅为兼容保留。X-Total-Count 为近似总数（无 query 时返回）。"""
     req_id = _req_id(request)
     if page < 1:
         page = 1
     if size < 1 or size > 100:
         size = 20
-    offset = (page - 1) * size
-    q = db.query(User)
+    q = db.query(User, Entitlement).outerjoin(Entitlement, Entitlement.user_id == User.id)
     if query and query.strip():
-        q = q.filter(
-            or_(
-                User.email.ilike(f"%{query.strip()}%"),
-                User.phone.ilike(f"%{query.strip()}%"),
-                User.id.ilike(f"%{query.strip()}%"),
+        # 优先走子串搜索索引（FTS5 trigram / n-gram），短查询或索引不可用时回退 ilike
+        ids = search_index.matching_ids(query)
+        if ids is not None:
+            q = q.filter(User.id.in_(ids))
+        if ids is None or not search_index.is_exact():
+            q = q.filter(
+                or_(
+                    User.email.ilike(f"%{query.strip()}%"),
+                    User.phone.ilike(f"%{query.strip()}%"),
+                    User.id.ilike(f"%{query.strip()}%"),
+                )
             )
+    # keyset 用行值比较，SQLite / MySQL 均走 (created_at, id) 索引区间扫描；不把 IS NULL 以 OR 并入区间条件（会退化为全索引扫描）。
+    # 倒序时 created_at 为 NULL 的行排在最后：非 NULL 部分取不满一页时再从 NULL 段按 id 倒序补齐，游标停在 NULL 行后只查 NULL 段
+    base = q
+    after_created_at = None
+    if cursor:
+        after_created_at, after_id = _decode_cursor(cursor)
+        if after_created_at is None:
+            q = q.filter(User.created_at.is_(None), User.id < after_id)
+        else:
+            q = q.filter(tuple_(User.created_at, User.id) < (after_created_at, after_id))
+    elif page > 1:
+        q = q.offset((page - 1) * size)
+    rows = q.order_by(User.created_at.desc(), User.id.desc()).limit(size).all()
+    if after_created_at is not None and len(rows) < size:
+        rows += (
+            base.filter(User.created_at.is_(None)).order_by(User.id.desc()).limit(size - len(rows)).all()
         )
-    users = q.order_by(User.created_at.desc()).offset(offset).limit(size).all()
     items = []
-    for u in users:
-        trial_end = _trial_end_ts(db, u.id)
+    for u, ent in rows:
         items.append(
             AdminUserListItem(
                 username=_username_of(u),
                 user_id=u.id,
                 created_at=u.created_at.isoformat() if u.created_at else None,
                 disabled=(u.status or "active") != "active",
-                trial_end=trial_end,
-                plan=getattr(u, "plan", None) or "free",
+                trial_end=ent.trial_end_ts if ent else None,
+                plan=ent.plan if ent else entitlements.FREE,
             )
         )
+    if len(rows) == size:
+        last = rows[-1][0]
+        response.headers["X-Next-Cursor"] = _encode_cursor(last.created_at, last.id)
+    if not (query and query.strip()):
+        response.headers["X-Total-Count"] = str(_approx_user_count(db))
     auth_audit_log(req_id, str(request.url), "list_users", None, "success", {"count": len(items), "page": page})
     return items
 
 
+# ----- GET /admin/users/export -----
+_EXPORT_BATCH = 1000
+_EXPORT_FIELDS = (
+    "user_id", "email", "phone", "status", "plan", "effective_plan", "created_at", "last_login_at",
+    "trial_start", "trial_end", "plan_expires",
+)
+
+
+def _export_rows() -> Iterator[list]:
+    """服务端游标逐批读取 users LEFT JOIN entitlements（yield_per），每次产出一批 dict，内存与总行数无关。
+    StreamingResponse 在请求依赖退出后才迭代，故使用独立会话。"""
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            select(
+                User.id, User.email, User.phone, User.status, User.created_at, User.last_login_at,
+                Entitlement.plan, Entitlement.trial_start_ts, Entitlement.trial_end_ts,
+                Entitlement.subscription_expires_ts,
+            )
+            .outerjoin(Entitlement, Entitlement.user_id == User.id)
+            .order_by(User.id)
+            .execution_options(stream_results=True, yield_per=_EXPORT_BATCH)
+        )
+        for partition in result.partitions():
+            yield [
+                {
+                    "user_id": uid,
+                    "email": email,
+                    "phone": phone,
+                    "status": user_status or "active",
+                    "plan": plan or entitlements.FREE,
+                    "effective_plan": entitlements.effective_plan(plan, trial_end, plan_exp),
+                    "created_at": created_at.isoformat() if created_at else None,
+                    "last_login_at": last_login_at.isoformat() if last_login_at else None,
+                    "trial_start": trial_start,
+                    "trial_end": trial_end,
+                    "plan_expires": plan_exp,
+                }
+                for uid, email, phone, user_status, created_at, last_login_at, plan, trial_start, trial_end, plan_exp
+                in partition
+            ]
+    finally:
+        db.close()
+
+
+def _export_chunks(fmt: str) -> Iterator[str]:
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=_EXPORT_FIELDS)
+        writer.writeheader()
+        yield buf.getvalue()
+        for batch in _export_rows():
+            buf.seek(0)
+            buf.truncate()
+            writer.writerows(batch)
+            yield buf.getvalue()
+        return
+    for batch in _export_rows():
+        yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in batch)
+
+
+def _gzip_chunks(chunks: Iterator[str]) -> Iterator[bytes]:
+    """逐批压缩并 Z_SYNC_FLUSH，使每批数据立即发出而不是积压在压缩器里。"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@router.get("/users/export")
+def admin_export_users(
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    gzip: bool = False,
+    admin: str = Depends(get_current_admin),
+):
+    """流式导出全部用户（含 status、plan、试用与付费到期），NDJSON（默认）或 CSV，gzip=true 时整体 gzip 压缩。
+    服务端游标按批读取，内存占用不随用户数增长；首批数据读出即开始发送。"""
+    req_id = _req_id(request)
+    auth_audit_log(req_id, str(request.url), "export_users", None, "success", {"format": format, "gzip": gzip})
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    filename = "users." + format
+    body = (chunk.encode("utf-8") for chunk in _export_chunks(format))
+    if gzip:
+        media_type = "application/gzip"
+        filename += ".gz"
+        body = _gzip_chunks(_export_chunks(format))
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
+
+
 # ----- GET /admin/users/{username} -----
 @router.get("/users/{username}", response_model=AdminUserDetail)
 def admin_get_user(
@@ -151,17 +324,16 @@ def admin_get_user(
     if not user:
         auth_audit_log(req_id, str(request.url), "get_user", username, "failure", {"reason": "not_found"})
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail={"code": "user_not_found", "message": "用户不存在"})
-    trial_end = _trial_end_ts(db, user.id)
-    trial_start = _trial_start_ts(db, user.id)
+    ent = db.get(Entitlement, user.id)
     auth_audit_log(req_id, str(request.url), "get_user", _username_of(user), "success", {"user_id": user.id})
     return AdminUserDetail(
         username=_username_of(user),
         user_id=user.id,
         created_at=user.created_at.isoformat() if user.created_at else None,
         disabled=(user.status or "active") != "active",
-        trial_end=trial_end,
-        trial_start=trial_start,
-        plan=getattr(user, "plan", None) or "free",
+        trial_end=ent.trial_end_ts if ent else None,
+        trial_start=ent.trial_start_ts if ent else None,
+        plan=ent.plan if ent else entitlements.FREE,
         last_login_at=user.last_login_at.isoformat() if user.last_login_at else None,
     )
 
@@ -180,8 +352,14 @@ def admin_disable_user(
         auth_audit_log(req_id, str(request.url), "disable_user", username, "failure", {"reason": "not_found"})
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail={"code": "user_not_found", "message": "用户不存在"})
     user.status = "disabled"
+    user_cache.bump_state_version(db, user.id)
+    epoch = token_epochs.bump(db, user.id)
     db.commit()
     db.refresh(user)
+    token_epochs.observe(user.id, epoch)
+    user_cache.invalidate(user.id)
+    token_store.revoke_all_for_user(db, user.id)
+    events.publish(user.id, "status", {"status": "disabled"})
     auth_audit_log(req_id, str(request.url), "disable_user", _username_of(user), "success", {"status": "disabled"})
     return {"ok": True, "username": _username_of(user), "status": "disabled"}
 
@@ -200,23 +378,35 @@ def admin_enable_user(
         auth_audit_log(req_id, str(request.url), "enable_user", username, "failure", {"reason": "not_found"})
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail={"code": "user_not_found", "message": "用户不存在"})
     user.status = "active"
+    user_cache.bump_state_version(db, user.id)
     db.commit()
     db.refresh(user)
+    user_cache.invalidate(user.id)
+    events.publish(user.id, "status", {"status": "active"})
     auth_audit_log(req_id, str(request.url), "enable_user", _username_of(user), "success", {"status": "active"})
     return {"ok": True, "username": _username_of(user), "status": "active"}
 
 
 # ----- POST /admin/users/{username}/reset-password -----
+def _set_password_hash(db: Session, user: User, password_hash: str) -> None:
+    user.password_hash = password_hash
+    epoch = token_epochs.bump(db, user.id)
+    db.commit()
+    token_epochs.observe(user.id, epoch)
+    user_cache.invalidate(user.id)
+    token_store.revoke_all_for_user(db, user.id)
+
+
 @router.post("/users/{username}/reset-password", response_model=AdminResetPasswordResponse)
-def admin_reset_password(
+async def admin_reset_password(
     username: str,
     request: Request,
     body: Optional[AdminResetPasswordBody] = None,
     admin: str = Depends(get_current_admin),
-    db: Session = Depends(get_db),
+    db=Depends(get_async_db),
 ):
     req_id = _req_id(request)
-    user = _get_user_by_username(db, username)
+    user = await db.run_sync(_get_user_by_username, username)
     if not user:
         auth_audit_log(req_id, str(request.url), "reset_password", username, "failure", {"reason": "not_found"})
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail={"code": "user_not_found", "message": "用户不存在"})
@@ -224,8 +414,8 @@ def admin_reset_password(
         new_pass = body.new_password
     else:
         new_pass = secrets.token_urlsafe(12)
-    user.password_hash = hash_password(new_pass)
-    db.commit()
+    password_hash = await hash_password_async(new_pass)
+    await db.run_sync(_set_password_hash, user, password_hash)
     if body and body.new_password:
         auth_audit_log(req_id, str(request.url), "reset_password", _username_of(user), "success", {"message": "password_updated"})
         return AdminResetPasswordResponse(message="密码已更新")
@@ -248,10 +438,270 @@ def admin_delete_user(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail={"code": "user_not_found", "message": "用户不存在"})
     uid = user.id
     uname = _username_of(user)
+    # 先吊销（写入内存过滤器），再删行
+    token_store.revoke_all_for_user(db, uid)
+    epoch = token_epochs.bump(db, uid)
     db.query(RefreshToken).filter(RefreshToken.user_id == uid).delete()
     db.query(Subscription).filter(Subscription.user_id == uid).delete()
-    db.execute(text("DELETE FROM trials WHERE username = :u"), {"u": uid})
+    entitlements.delete(db, uid)
+    search_index.remove_user(db, uid)
     db.delete(user)
     db.commit()
+    token_epochs.observe(uid, epoch)
+    user_cache.invalidate(uid)
+    events.publish(uid, "status", {"status": "deleted"})
     auth_audit_log(req_id, str(request.url), "delete_user", uname, "success", {"deleted_user_id": uid})
-    return {"ok": True, "username": uname, "message": "用户已删除"}
\ No newline at end of file
+    return {"ok": True, "username": uname, "message": "用户已删除"}
+
+
+# ----- POST /admin/users:bulk -----
+# 每块的 id 数：解析时 email/phone/id 三个 IN 共 3 × 300 个参数，低于旧版 SQLite 的 999 上限
+_BULK_CHUNK = 300
+
+
+def _resolve_users(db: Session, identifiers: list) -> dict:
+    """identifier（email / phone / user_id）-> user_id，每块一次 IN 查询；未找到的不在结果中。"""
+    wanted = list(dict.fromkeys(i.strip() for i in identifiers if i and i.strip()))
+    found = {}
+    for i in range(0, len(wanted), _BULK_CHUNK):
+        chunk = wanted[i:i + _BULK_CHUNK]
+        keys = set(chunk)
+        rows = (
+            db.query(User.id, User.email, User.phone)
+            .filter(or_(User.email.in_(chunk), User.phone.in_(chunk), User.id.in_(chunk)))
+            .all()
+        )
+        for uid, email, phone in rows:
+            for key in (email, phone, uid):
+                if key in keys:
+                    found[key] = uid
+    return found
+
+
+def _bulk_apply(db: Session, body: AdminBulkBody, chunk: list, now: datetime, epochs: dict, revoked: list) -> None:
+    """对一块 user_id 执行集合式 UPDATE / DELETE（不 commit）。"""
+    action = body.action
+    if action in ("disable", "enable"):
+        db.query(User).filter(User.id.in_(chunk)).update(
+            {User.status: "disabled" if action == "disable" else "active"}, synchronize_session=False
+        )
+        user_cache.bump_state_versions(db, chunk)
+        if action == "disable":
+            epochs.update(token_epochs.bump_many(db, chunk))
+            revoked.extend(token_store.revoke_all_for_users(db, chunk, now))
+    elif action == "delete":
+        epochs.update(token_epochs.bump_many(db, chunk))
+        revoked.extend(token_store.revoke_all_for_users(db, chunk, now))
+        db.query(RefreshToken).filter(RefreshToken.user_id.in_(chunk)).delete(synchronize_session=False)
+        db.query(Subscription).filter(Subscription.user_id.in_(chunk)).delete(synchronize_session=False)
+        entitlements.delete_many(db, chunk)
+        search_index.remove_users(db, chunk)
+        db.query(User).filter(User.id.in_(chunk)).delete(synchronize_session=False)
+    elif action == "extend_trial":
+        entitlements.extend_trials(db, chunk, body.days)
+        user_cache.bump_state_versions(db, chunk)
+    elif action == "set_plan":
+        entitlements.set_plans(db, chunk, body.plan, body.expires_at)
+        user_cache.bump_state_versions(db, chunk)
+
+
+_BULK_STATUS_EVENTS = {"disable": "disabled", "enable": "active", "delete": "deleted"}
+_BULK_AUDIT_IDS = 1000
+
+
+@router.post("/users:bulk", response_model=AdminBulkResponse)
+def admin_bulk_users(
+    body: AdminBulkBody,
+    request: Request,
+    admin: str = Depends(get_current_admin),
+    db: Session = Depends(get_db),
+):
+    """批量禁用 / 启用 / 删除 / 延长试用 / 设置套餐（最多 20000 个用户）。
+    用户按块 IN 查询解析，变更按块集合式执行，整体一个事务一次 commit；返回逐项结果，只写一条审计记录。
+    试用与套餐变更的 SSE 事件由扫描器按 state_version 发出。"""
+    req_id = _req_id(request)
+    if body.action == "extend_trial" and not body.days:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=err_invalid_params("extend_trial 需要 days"))
+    if body.action == "set_plan" and not body.plan:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=err_invalid_params("set_plan 需要 plan"))
+    resolved = _resolve_users(db, body.usernames)
+    user_ids = list(dict.fromkeys(resolved.values()))
+    now = datetime.utcnow()
+    epochs: dict = {}
+    revoked: list = []
+    try:
+        for i in range(0, len(user_ids), _BULK_CHUNK):
+            _bulk_apply(db, body, user_ids[i:i + _BULK_CHUNK], now, epochs, revoked)
+        db.commit()
+    except Exception:
+        db.rollback()
+        auth_audit_log(req_id, str(request.url), "bulk_" + body.action, None, "failure", {"matched": len(user_ids)})
+        raise
+    token_store.mark_revoked(revoked, now)
+    for uid, epoch in epochs.items():
+        token_epochs.observe(uid, epoch)
+    event_status = _BULK_STATUS_EVENTS.get(body.action)
+    for uid in user_ids:
+        user_cache.invalidate(uid)
+        if event_status:
+            events.publish(uid, "status", {"status": event_status})
+    results = []
+    for name in body.usernames:
+        uid = resolved.get((name or "").strip())
+        results.append(AdminBulkItem(username=name, user_id=uid, ok=uid is not None, error=None if uid else "not_found"))
+    failed = sum(1 for r in results if not r.ok)
+    auth_audit_log(
+        req_id, str(request.url), "bulk_" + body.action, None, "success",
+        {
+            "requested": len(body.usernames),
+            "matched": len(user_ids),
+            "not_found": failed,
+            "days": body.days,
+            "plan": body.plan,
+            "user_ids": user_ids[:_BULK_AUDIT_IDS],
+            "user_ids_truncated": len(user_ids) > _BULK_AUDIT_IDS,
+        },
+    )
+    return AdminBulkResponse(
+        action=body.action,
+        total=len(results),
+        succeeded=len(results) - failed,
+        failed=failed,
+        results=results,
+    )
+
+
+# ----- POST /admin/users:import -----
+def _filter_batch_sync(db: Session, batch: list, stats: user_import.ImportStats) -> list:
+    new, skipped = user_import.filter_new(db, batch)
+    stats.skipped_existing += skipped
+    return new
+
+
+def _insert_batch_sync(db: Session, batch: list, stats: user_import.ImportStats) -> None:
+    imported, skipped = user_import.insert_batch(db, batch)
+    stats.imported += imported
+    stats.skipped_existing += skipped
+
+
+async def _import_batch(db: Session, batch: list, stats: user_import.ImportStats) -> None:
+    """去重 -> 只对新记录 hash 明文 -> executemany 写入并 commit。"""
+    new = await run_in_threadpool(_filter_batch_sync, db, batch, stats)
+    await user_import.hash_plaintext(new)
+    await run_in_threadpool(_insert_batch_sync, db, new, stats)
+
+
+@router.post("/users:import", response_model=AdminImportResponse)
+async def admin_import_users(
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    admin: str = Depends(get_current_admin),
+):
+    """流式导入用户：请求体为 NDJSON 或带表头的 CSV（可 Content-Encoding: gzip），边读边按批写入。
+    每条记录为 username + password_hash（bcrypt）或 password（明文，经 bcrypt 进程池 hash）；
+    已存在的 email / phone 跳过，不合法的行记入 errors，不中断导入。每批单独 commit，失败时已提交的批次保留。"""
+    req_id = _req_id(request)
+    stats = user_import.ImportStats()
+    parser = user_import.LineParser(format)
+    gzipped = request.headers.get("content-encoding", "").lower() == "gzip"
+    decoder = zlib.decompressobj(31) if gzipped else None
+    db = SessionLocal()
+    buf = b""
+    batch: list = []
+    line_no = 0
+    try:
+        async for chunk in request.stream():
+            if decoder is not None:
+                try:
+                    chunk = decoder.decompress(chunk)
+                except zlib.error:
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=err_invalid_params("gzip 数据损坏"))
+            *lines, buf = (buf + chunk).split(b"\n")
+            for line in lines:
+                line_no += 1
+                rec = user_import.parse_record(parser, line.decode("utf-8", "replace"), line_no, stats)
+                if rec is not None:
+                    batch.append(rec)
+                if len(batch) >= user_import.BATCH_SIZE:
+                    await _import_batch(db, batch, stats)
+                    batch = []
+        if buf:
+            rec = user_import.parse_record(parser, buf.decode("utf-8", "replace"), line_no + 1, stats)
+            if rec is not None:
+                batch.append(rec)
+        if batch:
+            await _import_batch(db, batch, stats)
+    except HTTPException:
+        raise
+    except Exception:
+        auth_audit_log(req_id, str(request.url), "import_users", None, "failure", stats.as_dict())
+        raise
+    finally:
+        await run_in_threadpool(db.close)
+    result = stats.as_dict()
+    auth_audit_log(
+        req_id, str(request.url), "import_users", None, "success",
+        {k: v for k, v in result.items() if k != "errors"},
+    )
+    return AdminImportResponse(**result)
+
+
+# ----- GET /admin/audit -----
+def _utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """audit_log.ts 存 UTC naive；带时区的查询参数先换算到 UTC。"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@router.get("/audit", response_model=list[AdminAuditItem])
+def admin_list_audit(
+    request: Request,
+    response: Response,
+    target_user: Optional[str] = None,
+    action: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    size: int = 50,
+    admin: str = Depends(get_current_admin),
+    db: Session = Depends(get_db),
+):
+    """按 ts 倒序查询审计记录；target_user / action 各走 (列, ts) 组合索引，since/until 为 ts 区间 [since, until)。
+    分页同 /admin/users：响应头 X-Next-Cursor 为下一页游标（keyset，不统计总数）。"""
+    req_id = _req_id(request)
+    if size < 1 or size > 500:
+        size = 50
+    q = db.query(AuditLog)
+    if target_user:
+        q = q.filter(AuditLog.target_user == target_user)
+    if action:
+        q = q.filter(AuditLog.action == action)
+    if since:
+        q = q.filter(AuditLog.ts >= _utc_naive(since))
+    if until:
+        q = q.filter(AuditLog.ts < _utc_naive(until))
+    if cursor:
+        after_ts, after_id = _decode_cursor(cursor)
+        if after_ts is None or not after_id.isdigit():
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=err_invalid_params("cursor 无效"))
+        q = q.filter(
+            or_(AuditLog.ts < after_ts, and_(AuditLog.ts == after_ts, AuditLog.id < int(after_id)))
+        )
+    rows = q.order_by(AuditLog.ts.desc(), AuditLog.id.desc()).limit(size).all()
+    if len(rows) == size:
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1].ts, str(rows[-1].id))
+    auth_audit_log(req_id, str(request.url), "list_audit", target_user, "success", {"count": len(rows)})
+    return [
+        AdminAuditItem(
+            id=r.id,
+            ts=r.ts.isoformat() + "Z",
+            request_id=r.request_id,
+            url=r.url,
+            action=r.action,
+            target_user=r.target_user or None,
+            status=r.status,
+            response=r.response,
+        )
+        for r in rows
+    ]
@@ -1,38 +1,60 @@
-"""POST /register, /login（无 /auth 前缀）；/refresh, /status, /trial/*"""
-import hashlib
+"""POST /register, /login（无 /auth 前缀）；/refresh, /status, /trial/*, /events"""
 import re
 import time
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Optional
 
-from fastapi import APIRouter, Body, Depends, HTTPException, status
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-
+from starlette.concurrency import run_in_threadpool
+
+import entitlements
+import events
+import password_hasher
+import search_index
+import token_store
+import user_cache
 from config import settings
-from database import get_db
+from database import SessionLocal, get_async_db, get_db
 from deps import (
+    check_login_rate,
+    claims_current,
+    claims_etag,
     create_access_token,
-    create_refresh_token,
-    decode_access_token,
-    decode_refresh_token,
+    decode_access_claims,
+    etag_headers,
+    etag_matches,
+    get_admin_or_service,
     get_current_user,
-    hash_password,
+    get_current_user_async,
+    hash_password_async,
+    load_active_user,
+    load_user_snapshot,
+    not_modified,
     security,
-    verify_password,
+    status_etag,
+    user_id_from_credentials,
+    verify_password_async,
 )
-from models import RefreshToken, Subscription, User
+from models import Entitlement, Subscription, User
 from schemas import (
     AuthResponse,
+    BootstrapResponse,
     ErrorDetail,
+    IntrospectBatchBody,
+    IntrospectBatchResponse,
+    IntrospectResult,
     LoginBody,
     LoginResponse,
     RefreshBody,
     RefreshResponse,
     RegisterBody,
+    SubscriptionOut,
     TrialOut,
+    TrialStatusOut,
     UserOut,
     UserStatusResponse,
     err_account_exists,
@@ -40,6 +62,7 @@ from schemas import (
     err_wrong_password,
     err_token_invalid,
 )
+from user_cache import UserSnapshot
 
 router = APIRouter(prefix="", tags=["auth"])
 
@@ -52,88 +75,43 @@ def is_phone(s: str) -> bool:
     return bool(re.match(r"^1[3-9]\d{9}$", s))
 
 
-def token_hash(raw: str) -> str:
-    return hashlib.sha256(raw.encode()).hexdigest()
+def _iso_ts(ts: Optional[int]) -> Optional[str]:
+    return datetime.utcfromtimestamp(ts).isoformat() + "Z" if ts else None
 
 
-def build_user_status_response(user: User, db: Optional[Session] = None) -> UserStatusResponse:
-    """拼装 /auth/status 返回结构（含 plan、trial）。trial 优先从 trials 表读取（与 /auth/trial/* 一致）。"""
+def build_user_status_response(user: UserSnapshot) -> UserStatusResponse:
+    """拼装 /auth/status 返回结构（含 plan、trial），全部来自快照中的 entitlements 字段，不查库。"""
     username = user.email or user.phone or user.id
-    plan = getattr(user, "plan", None) or "free"
-    trial: Optional[TrialOut] = None
-
-    if db is not None:
-        row = db.execute(
-            text("SELECT start_ts, end_ts FROM trials WHERE username = :u"),
-            {"u": user.id},
-        ).fetchone()
-        if row and row[0] is not None and row[1] is not None:
-            start_ts, end_ts = row[0], row[1]
-            now_ts = int(time.time())
-            is_active = end_ts > now_ts
-            is_expired = end_ts <= now_ts
-            trial = TrialOut(
-                start_at=datetime.utcfromtimestamp(start_ts).isoformat() + "Z" if start_ts else None,
-                end_at=datetime.utcfromtimestamp(end_ts).isoformat() + "Z" if end_ts else None,
-                is_active=is_active,
-                is_expired=is_expired,
-            )
-            if is_active:
-                plan = "trial"
-        else:
-            trial = TrialOut(is_active=False, is_expired=False)
-    else:
-        trial_start_at = getattr(user, "trial_start_at", None)
-        trial_end_at = getattr(user, "trial_end_at", None)
-        now = datetime.utcnow()
-        end_dt = trial_end_at
-        is_active = end_dt is not None and now < end_dt
-        is_expired = end_dt is not None and now >= end_dt
+    now_ts = int(time.time())
+    end_ts = user.trial_end_ts
+    if user.trial_start_ts is not None and end_ts is not None:
         trial = TrialOut(
-            start_at=trial_start_at.isoformat() if trial_start_at else None,
-            end_at=trial_end_at.isoformat() if trial_end_at else None,
-            is_active=is_active,
-            is_expired=is_expired,
+            start_at=_iso_ts(user.trial_start_ts),
+            end_at=_iso_ts(end_ts),
+            is_active=end_ts > now_ts,
+            is_expired=end_ts <= now_ts,
         )
-        if is_active:
-            plan = "trial"
-
+    else:
+        trial = TrialOut(is_active=False, is_expired=False)
     return UserStatusResponse(
         username=username,
         status=user.status or "active",
-        plan=plan,
+        plan=entitlements.effective_plan(user.plan, end_ts, user.subscription_expires_ts, now_ts),
         created_at=user.created_at.isoformat() if user.created_at else None,
         last_login_at=user.last_login_at.isoformat() if user.last_login_at else None,
         trial=trial,
     )
 
 
-@router.post("/register", response_model=AuthResponse)
-def register(body: RegisterBody, db: Session = Depends(get_db)):
-    identifier = (body.username or "").strip()
-    if not identifier:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=err_invalid_params("请输入手机号或邮箱"),
-        )
-    if not is_email(identifier) and not is_phone(identifier):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=err_invalid_params("请输入有效的手机号或邮箱"),
-        )
-
+def _find_user_by_identifier(db: Session, identifier: str) -> Optional[User]:
     if is_email(identifier):
-        existing = db.query(User).filter(User.email == identifier).first()
-    else:
-        existing = db.query(User).filter(User.phone == identifier).first()
-    if existing:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=err_account_exists(),
-        )
+        return db.query(User).filter(User.email == identifier).first()
+    return db.query(User).filter(User.phone == identifier).first()
 
+
+def _create_user(db: Session, identifier: str, password_hash: str) -> tuple[User, UserSnapshot, str]:
+    """插入用户、权益行、默认订阅与 refresh_token；返回 (user, 快照, refresh_raw)。"""
     user_id = str(uuid.uuid4())
-    password_hash = hash_password(body.password)
     now = datetime.utcnow()
     user = User(
         id=user_id,
@@ -146,6 +124,8 @@ def register(body: RegisterBody, db: Session = Depends(get_db)):
         plan="free",
     )
     db.add(user)
+    search_index.add_user(db, user)
+    entitlement = entitlements.create(db, user_id)
 
     # 预留：创建默认订阅
     sub = Subscription(
@@ -158,47 +138,80 @@ def register(body: RegisterBody, db: Session = Depends(get_db)):
     )
     db.add(sub)
 
-    access_token = create_access_token(user_id)
-    refresh_raw = create_refresh_token(user_id)
-    refresh_hashed = token_hash(refresh_raw)
-    expires_at = now + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    rt = RefreshToken(
-        id=str(uuid.uuid4()),
-        user_id=user_id,
-        token_hash=refresh_hashed,
-        expires_at=expires_at,
-    )
-    db.add(rt)
+    refresh_raw = token_store.issue(db, user_id, now)
     db.commit()
     db.refresh(user)
+    return user, user_cache.put(user, entitlement), refresh_raw
+
+
+def _record_login(db: Session, user: User) -> tuple[UserSnapshot, str]:
+    """更新 last_login_at 并签发 refresh_token，一次 commit；返回 (刷新后的用户快照, refresh_raw)。
+    refresh_token 必须返回给客户端：每用户只保留最新的 REFRESH_TOKENS_PER_USER 个，不返回的行会挤掉客户端手里的那个。"""
+    now = datetime.utcnow()
+    user.last_login_at = now
+    user_cache.bump_state_version(db, user.id)
+    refresh_raw = token_store.issue(db, user.id, now)
+    db.commit()
+    db.refresh(user)
+    return user_cache.put(user, db.get(Entitlement, user.id)), refresh_raw
+
+
+def _user_out(user: User) -> UserOut:
+    return UserOut(
+        id=user.id,
+        email=user.email,
+        phone=user.phone,
+        created_at=user.created_at,
+        last_login_at=user.last_login_at,
+        status=user.status,
+    )
+
+
+# 高频路由为 async：bcrypt 在独立进程池执行，DB 访问经 get_async_db 的 run_sync，等待时不占线程
+@router.post("/register", response_model=AuthResponse)
+async def register(body: RegisterBody, db=Depends(get_async_db)):
+    identifier = (body.username or "").strip()
+    if not identifier:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=err_invalid_params("请输入手机号或邮箱"),
+        )
+    if not is_email(identifier) and not is_phone(identifier):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=err_invalid_params("请输入有效的手机号或邮箱"),
+        )
+
+    existing = await db.run_sync(_find_user_by_identifier, identifier)
+    if existing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=err_account_exists(),
+        )
+
+    password_hash = await hash_password_async(body.password)
+    user, snapshot, refresh_raw = await db.run_sync(_create_user, identifier, password_hash)
+    access_token = create_access_token(user.id, snapshot)
 
     return AuthResponse(
-        user=UserOut(
-            id=user.id,
-            email=user.email,
-            phone=user.phone,
-            created_at=user.created_at,
-            last_login_at=user.last_login_at,
-            status=user.status,
-        ),
+        user=_user_out(user),
         access_token=access_token,
         refresh_token=refresh_raw,
     )
 
 
 @router.post("/login", response_model=LoginResponse)
-def login(body: LoginBody, db: Session = Depends(get_db)):
+async def login(body: LoginBody, request: Request, db=Depends(get_async_db)):
+    """准入控制在查库与 bcrypt 之前：账号/IP 超限返回 429，登录占用的 bcrypt 在途任务超限返回 503，均带 Retry-After。"""
     identifier = (body.username or "").strip()
     if not identifier:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=err_invalid_params("请输入手机号或邮箱"),
         )
+    await check_login_rate(request, identifier)
 
-    if is_email(identifier):
-        user = db.query(User).filter(User.email == identifier).first()
-    else:
-        user = db.query(User).filter(User.phone == identifier).first()
+    user = await db.run_sync(_find_user_by_identifier, identifier)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -209,49 +222,23 @@ def login(body: LoginBody, db: Session = Depends(get_db)):
             status_code=status.HTTP_403_FORBIDDEN,
             detail={"code": "account_disabled", "message": "账户已被禁用"},
         )
-    if not verify_password(body.password, user.password_hash):
+    if not await verify_password_async(body.password, user.password_hash, limit=password_hasher.login_limit()):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=err_wrong_password(),
         )
 
-    user.last_login_at = datetime.utcnow()
-    db.commit()
-    db.refresh(user)
-
-    token = create_access_token(user.id)
-    refresh_raw = create_refresh_token(user.id)
-    refresh_hashed = token_hash(refresh_raw)
-    expires_at = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
-    rt = RefreshToken(
-        id=str(uuid.uuid4()),
-        user_id=user.id,
-        token_hash=refresh_hashed,
-        expires_at=expires_at,
-    )
-    db.add(rt)
-    db.commit()
+    snapshot, refresh_raw = await db.run_sync(_record_login, user)
+    token = create_access_token(user.id, snapshot)
 
     return LoginResponse(
-        user=UserOut(
-            id=user.id,
-            email=user.email,
-            phone=user.phone,
-            created_at=user.created_at,
-            last_login_at=user.last_login_at,
-            status=user.status,
-        ),
+        user=_user_out(user),
         token=token,
+        refresh_token=refresh_raw,
     )
 
 
-@router.post("/refresh", response_model=RefreshResponse)
-def refresh(
-    body: Optional[RefreshBody] = Body(None),
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-    db: Session = Depends(get_db),
-):
-    """校验 refresh_token（JWT type=refresh），成功仅返回新 access_token。支持 JSON body.refresh_token 或 Authorization: Bearer <refresh_token>"""
+def _refresh_raw_token(body: Optional[RefreshBody], credentials: Optional[HTTPAuthorizationCredentials]) -> str:
     raw = (body.refresh_token if body and body.refresh_token else "").strip() or (
         credentials.credentials if credentials else ""
     )
@@ -260,89 +247,186 @@ def refresh(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=err_token_invalid(),
         )
-    user_id = decode_refresh_token(raw)
+    return raw
+
+
+def _refresh(db: Session, raw: str) -> RefreshResponse:
+    """refresh_token 经 token_hash 索引校验（含吊销），用户须为 active；开启轮换时吊销旧 token 并签发新 token。
+    新 access_token 按当前快照内嵌最新权益 claims。"""
+    user_id = token_store.validate(db, raw)
     if not user_id:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=err_token_invalid(),
         )
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user or user.status != "active":
+    user = load_active_user(db, user_id)
+    new_refresh = token_store.rotate(db, raw, user.id) if settings.REFRESH_TOKEN_ROTATE else None
+    return RefreshResponse(access_token=create_access_token(user.id, user), refresh_token=new_refresh)
+
+
+@router.post("/refresh", response_model=RefreshResponse, response_model_exclude_none=True)
+async def refresh(
+    body: Optional[RefreshBody] = Body(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db=Depends(get_async_db),
+):
+    """校验 refresh_token（JWT type=refresh 且 refresh_tokens 中未吊销），成功返回新 access_token。支持 JSON body.refresh_token 或 Authorization: Bearer <refresh_token>"""
+    raw = _refresh_raw_token(body, credentials)
+    return await db.run_sync(_refresh, raw)
+
+
+@router.post("/logout")
+async def logout(
+    body: Optional[RefreshBody] = Body(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db=Depends(get_async_db),
+):
+    """POST /auth/logout：吊销传入的 refresh_token（body.refresh_token 或 Bearer），之后 /refresh 立即失效。"""
+    raw = _refresh_raw_token(body, credentials)
+    revoked = await db.run_sync(token_store.revoke, raw)
+    return {"ok": True, "revoked": revoked}
+
+
+def _trial_status_out(end_ts: Optional[int]) -> TrialStatusOut:
+    if end_ts is None:
+        return TrialStatusOut()
+    return TrialStatusOut(hasTrial=True, trialEndsAt=end_ts, isActive=end_ts > int(time.time()))
+
+
+def _bootstrap(db: Session, user_id: str) -> BootstrapResponse:
+    """users、entitlements、subscriptions 按主键一次联表查询，拼装启动所需全部信息。"""
+    row = (
+        db.query(User, Entitlement, Subscription)
+        .outerjoin(Entitlement, Entitlement.user_id == User.id)
+        .outerjoin(Subscription, Subscription.user_id == User.id)
+        .filter(User.id == user_id)
+        .first()
+    )
+    if not row or row[0].status != "active":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=err_token_invalid(),
         )
-    new_access = create_access_token(user.id)
-    return RefreshResponse(access_token=new_access)
+    user, entitlement, sub = row
+    snapshot = user_cache.put(user, entitlement)
+    status_out = build_user_status_response(snapshot)
+    return BootstrapResponse(
+        username=user_id,
+        user=_user_out(user),
+        status=status_out,
+        trial=_trial_status_out(snapshot.trial_end_ts),
+        subscription=SubscriptionOut(
+            plan=status_out.plan,
+            status=sub.status or "active",
+            current_period_end=sub.current_period_end,
+            features=list(sub.features_json or []),
+        )
+        if sub
+        else SubscriptionOut(plan=status_out.plan),
+    )
+
+
+@router.get("/bootstrap", response_model=BootstrapResponse)
+async def bootstrap(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db=Depends(get_async_db),
+):
+    """GET /auth/bootstrap：客户端启动/聚焦时调用，一次 token 解析 + 一次联表查询，
+    返回 /me、/auth/status、/auth/trial/status 与订阅信息的合集。"""
+    user_id = user_id_from_credentials(credentials)
+    return await db.run_sync(_bootstrap, user_id)
 
 
 @router.get("/status", response_model=UserStatusResponse)
-def user_status(user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """GET /auth/status：需 Bearer Token，仅返回当前登录用户的状态（只读，含 plan、trial）。trial 来自 trials 表。"""
-    return build_user_status_response(user, db)
+async def user_status(
+    request: Request,
+    response: Response,
+    user: UserSnapshot = Depends(get_current_user_async),
+):
+    """GET /auth/status：需 Bearer Token，仅返回当前登录用户的状态（只读，含 plan、trial）。plan、trial 来自 entitlements。
+    带 ETag；If-None-Match 命中时返回 304，不构建响应体。"""
+    etag = status_etag("status", user)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
+    return build_user_status_response(user)
 
 
 TRIAL_DAYS = 7
 
 
-@router.post("/trial/start")
-def trial_start(
-    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-    db: Session = Depends(get_db),
-):
-    """POST /auth/trial/start：开启 7 天试用，需 Authorization: Bearer <token>。未过期则返回当前 end_ts，否则 upsert 新 7 天。"""
+def _bearer_claims(credentials: Optional[HTTPAuthorizationCredentials]) -> dict:
+    """/trial/* 的 token 校验：错误信息与原接口保持一致（缺少 token / Invalid token）。"""
     if not credentials or not credentials.credentials:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="缺少 token")
     token = credentials.credentials.strip()
     if not token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="缺少 token")
-    username = decode_access_token(token)
-    if not username:
+    claims = decode_access_claims(token)
+    if not claims or not claims.get("sub"):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    # username 即 JWT payload 的 sub（当前为 user_id）
-    now_ts = int(time.time())
-    row = db.execute(
-        text("SELECT start_ts, end_ts FROM trials WHERE username = :u"),
-        {"u": username},
-    ).fetchone()
-    if row and row[1] and row[1] > now_ts:
-        return {"success": True, "trialEndsAt": row[1]}
-    start_ts = now_ts
-    end_ts = start_ts + 7 * 24 * 3600
-    db.execute(
-        text(
-            "INSERT OR REPLACE INTO trials(username, start_ts, end_ts) VALUES (:u, :s, :e)"
-        ),
-        {"u": username, "s": start_ts, "e": end_ts},
-    )
+    return claims
+
+
+def _bearer_sub(credentials: Optional[HTTPAuthorizationCredentials]) -> str:
+    return _bearer_claims(credentials)["sub"]
+
+
+def _start_trial(db: Session, username: str) -> int:
+    """未过期则返回当前 end_ts，否则开通新 TRIAL_DAYS 天（entitlements，SQLite / MySQL 通用）。"""
+    end_ts, started = entitlements.start_trial(db, username, TRIAL_DAYS)
+    if not started:
+        return end_ts
+    user_cache.bump_state_version(db, username)
     db.commit()
-    return {"success": True, "trialEndsAt": end_ts}
+    user_cache.invalidate(username)
+    events.publish(username, "trial", {"trialEndsAt": end_ts, "isActive": True})
+    return end_ts
+
+
+@router.post("/trial/start")
+async def trial_start(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+    db=Depends(get_async_db),
+):
+    """POST /auth/trial/start：开启 7 天试用，需 Authorization: Bearer <token>。未过期则返回当前 end_ts，否则 upsert 新 7 天。
+    同时返回内嵌新权益 claims 的 access_token，客户端替换后解码即可得到新的 plan / trial_end。"""
+    # username 即 JWT payload 的 sub（当前为 user_id）
+    username = _bearer_sub(credentials)
+    end_ts = await db.run_sync(_start_trial, username)
+    snapshot = await db.run_sync(load_user_snapshot, username)
+    result = {"success": True, "trialEndsAt": end_ts}
+    if snapshot is not None:
+        result["access_token"] = create_access_token(username, snapshot)
+    return result
 
 
 @router.get("/trial/status")
-def trial_status(
+async def trial_status(
+    request: Request,
+    response: Response,
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-    db: Session = Depends(get_db),
+    db=Depends(get_async_db),
 ):
-    """GET /auth/trial/status：需 Bearer token，只读返回当前用户试用状态。"""
-    if not credentials or not credentials.credentials:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="缺少 token")
-    username = decode_access_token(credentials.credentials.strip())
-    if not username:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    row = db.execute(
-        text("SELECT end_ts FROM trials WHERE username = :u"),
-        {"u": username},
-    ).fetchone()
-    if not row or row[0] is None:
-        return {"hasTrial": False, "trialEndsAt": None, "isActive": False}
-    end_ts = row[0]
-    now_ts = int(time.time())
-    return {
-        "hasTrial": True,
-        "trialEndsAt": end_ts,
-        "isActive": end_ts > now_ts,
-    }
+    """GET /auth/trial/status：需 Bearer token，只读返回当前用户试用状态。
+    token 内嵌的权益 claims 仍为最新（ev 与本进程权益版本一致）时直接据此应答；
+    否则取用户快照（缓存命中不查库）。带 ETag，If-None-Match 命中时返回 304。"""
+    claims = _bearer_claims(credentials)
+    if claims_current(claims):
+        etag = claims_etag("trial", claims)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response.headers.update(etag_headers(etag))
+        return _trial_status_out(claims.get("trial_end")).model_dump()
+    username = claims["sub"]
+    snapshot = user_cache.get(username) or await db.run_sync(load_user_snapshot, username)
+    if snapshot is None or snapshot.trial_end_ts is None:
+        return _trial_status_out(None).model_dump()
+    etag = status_etag("trial", snapshot)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
+    return _trial_status_out(snapshot.trial_end_ts).model_dump()
 
 
 def _admin_debug_enabled() -> bool:
@@ -351,17 +435,97 @@ def _admin_debug_enabled() -> bool:
 
 
 @router.post("/trial/debug/expire", response_model=UserStatusResponse)
-def trial_debug_expire(user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    """POST /auth/trial/debug/expire：仅当 ENABLE_ADMIN_DEBUG=true 时可用；将当前用户 trial_end_at 设为过去，用于验收“到期弹窗”。"""
+def trial_debug_expire(current: UserSnapshot = Depends(get_current_user), db: Session = Depends(get_db)):
+    """POST /auth/trial/debug/expire：仅当 ENABLE_ADMIN_DEBUG=true 时可用；将当前用户试用结束时间设为过去，用于验收“到期弹窗”。"""
     if not _admin_debug_enabled():
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
     try:
-        now = datetime.utcnow()
-        user.trial_end_at = now - timedelta(minutes=1)
+        entitlements.expire_trial(db, current.id)
+        user_cache.bump_state_version(db, current.id)
         db.commit()
-        db.refresh(user)
-        return build_user_status_response(user)
+        user_cache.invalidate(current.id)
+        return build_user_status_response(load_user_snapshot(db, current.id))
     except Exception as e:
         import logging
         logging.getLogger(__name__).exception("trial/debug/expire failed: %s", e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="debug expire failed")
+
+
+def _load_event_user(user_id: str) -> UserSnapshot:
+    """SSE 是长连接：只在建立时用短会话查一次，不占用请求级 Session。"""
+    db = SessionLocal()
+    try:
+        return load_active_user(db, user_id)
+    finally:
+        db.close()
+
+
+@router.get("/events")
+async def events_stream(
+    request: Request,
+    access_token: Optional[str] = Query(None),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
+):
+    """GET /auth/events：SSE 推送当前用户的 status / plan / trial 变更，替代客户端轮询 /auth/status。
+    Bearer token 或 ?access_token=（EventSource 无法设置请求头）；支持 Last-Event-ID 续传。
+    连接最长 EVENTS_MAX_STREAM_SECONDS，之后客户端用新 token 重连。"""
+    if not (credentials and credentials.credentials) and access_token:
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=access_token)
+    user_id = user_id_from_credentials(credentials)
+    snapshot = user_cache.get(user_id) or await run_in_threadpool(_load_event_user, user_id)
+    if snapshot.status != "active":
+        snapshot = await run_in_threadpool(_load_event_user, user_id)
+    known = (snapshot.state_version, snapshot.status, snapshot.plan, snapshot.trial_end_ts)
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("lastEventId")
+    return StreamingResponse(
+        events.stream(user_id, known, last_event_id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+_INTROSPECT_CHUNK = 300
+
+
+def _introspect_batch(db: Session, tokens: list) -> list:
+    """逐个解析 token（走 jwt_cache），用户状态先查快照缓存，其余按 _INTROSPECT_CHUNK 分块 IN 查询取回
+    （老版本 SQLite 单条语句最多 999 个绑定参数）。"""
+    claims = [decode_access_claims(t) for t in tokens]
+    subs = {c.get("sub") for c in claims if c and c.get("sub")}
+    statuses = {}
+    for sub in subs:
+        snapshot = user_cache.get(sub)
+        if snapshot is not None:
+            statuses[sub] = snapshot.status
+    missing = list(subs - statuses.keys())
+    for i in range(0, len(missing), _INTROSPECT_CHUNK):
+        rows = db.query(User.id, User.status).filter(User.id.in_(missing[i:i + _INTROSPECT_CHUNK])).all()
+        statuses.update({r[0]: r[1] for r in rows})
+    results = []
+    for c in claims:
+        if not c or not c.get("sub"):
+            results.append(IntrospectResult())
+            continue
+        sub = c["sub"]
+        user_status = statuses.get(sub, "deleted")
+        exp = c.get("exp")
+        results.append(
+            IntrospectResult(
+                active=user_status == "active",
+                sub=sub,
+                exp=int(exp) if isinstance(exp, (int, float)) else None,
+                status=user_status,
+            )
+        )
+    return results
+
+
+@router.post("/introspect:batch", response_model=IntrospectBatchResponse)
+def introspect_batch(
+    body: IntrospectBatchBody,
+    caller: str = Depends(get_admin_or_service),
+    db: Session = Depends(get_db),
+):
+    """POST /auth/introspect:batch：网关/内部服务批量校验 access_token（最多 5000 个），需管理员或服务 token。
+    每个 token 返回 active、sub、exp 与用户 status，顺序与请求一致。"""
+    return IntrospectBatchResponse(results=_introspect_batch(db, body.tokens))
@@ -1,84 +1,63 @@
 """GET /subscription/status：订阅状态查询，需 Bearer Token，仅允许查自己。
-对齐真相：users(id,username,password,is_disabled)；subscriptions(username,expires_at INT,plan,updated_at)。
-DB 连接使用 DB_PATH，默认 /data/users.db。
+数据来自用户快照（users JOIN entitlements 一次主键读取，命中缓存时不访问数据库）。
 """
 import time
 from typing import Any
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import or_, text
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 
-from database import get_db
-from deps import get_current_user
-from models import User
+from deps import etag_headers, etag_matches, get_current_user_async, not_modified, status_etag
+from entitlements import FREE, TRIAL, effective_plan
+from user_cache import UserSnapshot
 
 router = APIRouter(prefix="/subscription", tags=["subscription"])
 
 
-def _username_of(user: User) -> str:
+def _username_of(user: UserSnapshot) -> str:
     """token 对应用户的登录标识：user.email 或 user.phone 或 str(user.id)"""
     return user.email or user.phone or str(user.id)
 
 
+def _subscription_status(user: UserSnapshot, username: str) -> dict[str, Any]:
+    """expired 与 plan 同源：有效套餐为 free 即已过期。
+    expires_at：试用中为试用结束时间；付费套餐为付费到期时间（不过期的套餐为 0）；
+    free 时为最近失效的付费到期或试用结束时间，均无为 0。"""
+    now_ts = int(time.time())
+    plan = effective_plan(user.plan, user.trial_end_ts, user.subscription_expires_ts, now_ts)
+    if plan == TRIAL:
+        expires_at = user.trial_end_ts
+    elif plan != FREE:
+        expires_at = user.subscription_expires_ts or 0
+    else:
+        expires_at = user.subscription_expires_ts or user.trial_end_ts or 0
+    return {
+        "success": True,
+        "username": username,
+        "is_disabled": 1 if (user.status or "").lower() == "disabled" else 0,
+        "plan": plan,
+        "expires_at": expires_at,
+        "expired": plan == FREE,
+    }
+
+
 @router.get("/status")
-def subscription_status(
+async def subscription_status(
+    request: Request,
+    response: Response,
     username: str = Query(..., description="要查询的用户名（仅允许查自己）"),
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-) -> dict[str, Any]:
+    user: UserSnapshot = Depends(get_current_user_async),
+) -> Any:
     """
     必须 Authorization: Bearer <token>。
     只能查自己：username 必须等于 user.email 或 user.phone 或 str(user.id)，否则 403。
-    users 不存在则 404；subscriptions 无记录则 expired=true, expires_at=0, plan=trial。
+    无试用、无付费时 expired=true, expires_at=0, plan=free；不过期的付费套餐 expired=false, expires_at=0。
+    带 ETag；If-None-Match 命中时返回 304。
     """
     token_username = _username_of(user)
     if username != token_username:
         raise HTTPException(status_code=403, detail="forbidden: can only query own status")
-
-    # a) 查 users：按 username/email/phone/id，取 is_disabled；不存在 404
-    target = db.query(User).filter(
-        or_(User.email == username, User.phone == username, User.id == username)
-    ).first()
-    if not target:
-        raise HTTPException(
-            status_code=404,
-            detail={"success": False, "detail": "user not found"},
-        )
-    # is_disabled：表有 is_disabled 列则用，否则用 status 映射
-    is_disabled = 0
-    if getattr(target, "is_disabled", None) is not None:
-        is_disabled = 1 if target.is_disabled else 0
-    else:
-        is_disabled = 1 if (target.status or "").lower() == "disabled" else 0
-
-    # b) 查 subscriptions：表结构 username(PK), expires_at(INT unix), plan(TEXT)
-    now_ts = int(time.time())
-    try:
-        row = db.execute(
-            text("SELECT expires_at, plan FROM subscriptions WHERE username = :u"),
-            {"u": username},
-        ).fetchone()
-    except Exception:
-        row = None
-    if not row:
-        return {
-            "success": True,
-            "username": username,
-            "is_disabled": is_disabled,
-            "plan": "trial",
-            "expires_at": 0,
-            "expired": True,
-        }
-    expires_at = int(row[0]) if row[0] is not None else 0
-    plan = (row[1] or "trial").strip() if row[1] else "trial"
-    expired = expires_at < now_ts
-
-    return {
-        "success": True,
-        "username": username,
-        "is_disabled": is_disabled,
-        "plan": plan,
-        "expires_at": expires_at,
-        "expired": expired,
-    }
+    etag = status_etag("subscription", user, username)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
+    return _subscription_status(user, username)
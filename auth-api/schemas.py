@@ -63,14 +63,16 @@ class AuthResponse(BaseModel):
 
 
 class LoginResponse(BaseModel):
-    """/login 对齐：返回字段名为 token（非 access_token）"""
+    """/login 对齐：返回字段名为 token（非 access_token）；refresh_token 为本次登录签发、已入库的那一个"""
     user: UserOut
     token: str
+    refresh_token: Optional[str] = None
     token_type: str = "bearer"
 
 
 class RefreshResponse(BaseModel):
     access_token: str
+    refresh_token: Optional[str] = None  # 仅 REFRESH_TOKEN_ROTATE 开启时返回新的 refresh_token
     token_type: str = "bearer"
 
 
@@ -97,6 +99,39 @@ class UserStatusResponse(BaseModel):
     trial: Optional[TrialOut] = None
 
 
+# ----- GET /auth/bootstrap（客户端启动一次拿齐 /me + /auth/status + /auth/trial/status + 订阅） -----
+class TrialStatusOut(BaseModel):
+    """与 GET /auth/trial/status 字段一致"""
+    hasTrial: bool = False
+    trialEndsAt: Optional[int] = None
+    isActive: bool = False
+
+
+class BootstrapResponse(BaseModel):
+    ok: bool = True
+    username: str  # 与 GET /me 一致：JWT sub
+    user: UserOut
+    status: UserStatusResponse
+    trial: TrialStatusOut
+    subscription: SubscriptionOut
+
+
+# ----- POST /auth/introspect:batch（网关/内部服务批量校验 access_token） -----
+class IntrospectBatchBody(BaseModel):
+    tokens: List[str] = Field(..., min_length=1, max_length=5000)
+
+
+class IntrospectResult(BaseModel):
+    active: bool = False  # token 有效且用户存在、status=active
+    sub: Optional[str] = None
+    exp: Optional[int] = None
+    status: Optional[str] = None  # users.status；token 无效为 null，用户已删除为 "deleted"
+
+
+class IntrospectBatchResponse(BaseModel):
+    results: List[IntrospectResult]  # 与请求 tokens 顺序一一对应
+
+
 # ----- 错误规范 -----
 class ErrorDetail(BaseModel):
     code: str
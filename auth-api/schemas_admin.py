@@ -1,6 +1,6 @@
 """Admin API 请求/响应模型"""
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -19,7 +19,7 @@ class AdminUserListItem(BaseModel):
     user_id: str
     created_at: Optional[str] = None
     disabled: bool = False  # status != "active"
-    trial_end: Optional[int] = None  # trials.end_ts 或 null
+    trial_end: Optional[int] = None  # entitlements.trial_end_ts 或 null
     plan: str = "free"
 
 
@@ -36,3 +36,50 @@ class AdminResetPasswordResponse(BaseModel):
     ok: bool = True
     temp_password: Optional[str] = None  # 未传 new_password 时返回临时密码
     message: str = ""
+
+
+class AdminBulkBody(BaseModel):
+    usernames: List[str] = Field(..., min_length=1, max_length=20000)  # email / phone / user_id
+    action: Literal["disable", "enable", "delete", "extend_trial", "set_plan"]
+    days: Optional[int] = Field(None, ge=1, le=3650)  # extend_trial 必填
+    plan: Optional[str] = Field(None, min_length=1, max_length=32)  # set_plan 必填
+    expires_at: Optional[int] = None  # set_plan：付费到期 unix 秒，null 为不过期
+
+
+class AdminBulkItem(BaseModel):
+    username: str
+    user_id: Optional[str] = None
+    ok: bool = True
+    error: Optional[str] = None  # not_found
+
+
+class AdminBulkResponse(BaseModel):
+    action: str
+    total: int
+    succeeded: int
+    failed: int
+    results: List[AdminBulkItem]
+
+
+class AdminImportError(BaseModel):
+    line: int  # 输入中的行号（从 1 开始，CSV 含表头）
+    reason: str
+
+
+class AdminImportResponse(BaseModel):
+    total: int
+    imported: int
+    skipped_existing: int  # 已存在或输入内重复
+    invalid: int
+    errors: List[AdminImportError]  # 最多前 100 条
+
+
+class AdminAuditItem(BaseModel):
+    id: int
+    ts: str  # UTC ISO 时间
+    request_id: Optional[str] = None
+    url: Optional[str] = None
+    action: str
+    target_user: Optional[str] = None
+    status: Optional[str] = None
+    response: Optional[str] = None  # 已脱敏的 JSON 字符串
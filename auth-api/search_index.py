@@ -0,0 +1,207 @@
+"""管理端用户子串搜索索引（email / phone / id）。
+- SQLite：FTS5 trigram 虚表 users_search（需 SQLite >= 3.34）；user_id 为 UNINDEXED 列，按它删除要扫全表，
+  故每个用户在 user_search_rowids(rowid INTEGER PRIMARY KEY, user_id UNIQUE) 中分配一个整数 rowid，
+  FTS 行以该 rowid 为键，删除时经主键 / 唯一索引定位（不用 users.rowid：VACUUM 可能重排无整数主键表的 rowid）
+- MySQL：n-gram 表 user_search_ngrams(gram, user_id)，查询取包含全部 trigram 的候选再精确过滤
+注册、导入、删除时由调用方在同一事务中调用 add_user / add_many / remove_user / remove_users
+（email / phone / id 注册后不再变更，没有更新路径）。
+索引表的创建与回填是 schema 迁移步骤（migrate、rekey，只执行一次）；启动时 init 只按方言确定模式，不访问数据库。
+查询短于 3 个字符或索引不可用时返回 None，由调用方回退到 ilike。
+"""
+import logging
+import sqlite3
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import Column, MetaData, String, Table, bindparam, column, func, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from database import engine
+from models import User
+
+logger = logging.getLogger(__name__)
+
+GRAM = 3
+_BACKFILL_BATCH = 1000
+
+_metadata = MetaData()
+user_search_ngrams = Table(
+    "user_search_ngrams",
+    _metadata,
+    Column("gram", String(GRAM), primary_key=True),
+    Column("user_id", String(36), primary_key=True, index=True),
+)
+
+_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_search "
+    "USING fts5(user_id UNINDEXED, email, phone, uid, tokenize='trigram')"
+)
+_ROWIDS_DDL = (
+    "CREATE TABLE IF NOT EXISTS user_search_rowids "
+    "(rowid INTEGER PRIMARY KEY, user_id VARCHAR(36) NOT NULL UNIQUE)"
+)
+_FTS_INSERT_ROWID = text("INSERT INTO user_search_rowids(user_id) VALUES (:id)")
+_FTS_INSERT = text(
+    "INSERT INTO users_search(rowid, user_id, email, phone, uid) "
+    "SELECT rowid, :id, :e, :p, :id FROM user_search_rowids WHERE user_id = :id"
+)
+
+# None：未初始化；"fts5" / "ngram"：可用；"" ：不可用（回退 ilike）
+_mode: Optional[str] = None
+
+
+def _grams(values: Iterable[Optional[str]]) -> set:
+    out = set()
+    for v in values:
+        v = (v or "").lower()
+        for i in range(len(v) - GRAM + 1):
+            out.add(v[i:i + GRAM])
+    return out
+
+
+def _fts_phrase(q: str) -> str:
+    return '"' + q.replace('"', '""') + '"'
+
+
+def _fts5_trigram_available() -> bool:
+    """在内存库上探测 FTS5 trigram 分词器（SQLite >= 3.34），不触碰业务库。"""
+    try:
+        probe = sqlite3.connect(":memory:")
+        try:
+            probe.execute("CREATE VIRTUAL TABLE t USING fts5(x, tokenize='trigram')")
+        finally:
+            probe.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def _detect_mode(dialect: str) -> str:
+    if dialect == "sqlite":
+        return "fts5" if _fts5_trigram_available() else ""
+    if dialect == "mysql":
+        return "ngram"
+    return ""
+
+
+def init() -> None:
+    """启动时按方言确定索引模式；索引表由迁移步骤建好。"""
+    global _mode
+    dialect = engine.dialect.name
+    _mode = _detect_mode(dialect)
+    if not _mode:
+        logger.warning("user search index unavailable (%s), falling back to ilike", dialect)
+
+
+def migrate(conn: Connection) -> None:
+    """迁移步骤：建索引表，索引为空时按 users 分批回填（在迁移连接的事务内执行，不 commit）。
+    引入迁移之前启动时已建好的索引保留不动；SQLite 不支持 FTS5 trigram 时跳过，搜索回退 ilike。"""
+    mode = _detect_mode(conn.dialect.name)
+    if mode == "fts5":
+        conn.execute(text(_FTS_DDL))
+        conn.execute(text(_ROWIDS_DDL))
+        probe = text("SELECT 1 FROM users_search LIMIT 1")
+    elif mode == "ngram":
+        _metadata.create_all(bind=conn)
+        probe = select(user_search_ngrams.c.user_id).limit(1)
+    else:
+        return
+    if conn.execute(probe).first() is not None:
+        return
+    last_id = ""
+    while True:
+        rows = conn.execute(
+            select(User.id, User.email, User.phone).where(User.id > last_id).order_by(User.id).limit(_BACKFILL_BATCH)
+        ).all()
+        if not rows:
+            break
+        _add_rows(conn, [tuple(r) for r in rows], mode)
+        last_id = rows[-1][0]
+
+
+def rekey(conn: Connection) -> None:
+    """迁移步骤：FTS5 索引改为以 user_search_rowids 分配的 rowid 为键（之前建出的索引行 rowid 与用户无对应关系，整体重建）。
+    新库在 migrate 中已建好 user_search_rowids，此时为空操作。"""
+    if _detect_mode(conn.dialect.name) != "fts5":
+        return
+    conn.execute(text(_FTS_DDL))
+    conn.execute(text(_ROWIDS_DDL))
+    if conn.execute(text("SELECT 1 FROM user_search_rowids LIMIT 1")).first() is not None:
+        return
+    conn.execute(text("DELETE FROM users_search"))
+    conn.execute(text("INSERT INTO user_search_rowids(user_id) SELECT id FROM users"))
+    conn.execute(
+        text(
+            "INSERT INTO users_search(rowid, user_id, email, phone, uid) "
+            "SELECT m.rowid, u.id, COALESCE(u.email, ''), COALESCE(u.phone, ''), u.id "
+            "FROM users u JOIN user_search_rowids m ON m.user_id = u.id"
+        )
+    )
+
+
+def add_user(db: Session, user: Any) -> None:
+    """新用户写入索引（不 commit，随调用方事务提交）。"""
+    _add_rows(db, [(user.id, user.email, user.phone)], _mode)
+
+
+def add_many(db: Session, rows: list) -> None:
+    """批量写入索引（executemany，不 commit）；rows 为 (user_id, email, phone)。"""
+    _add_rows(db, rows, _mode)
+
+
+def _add_rows(db: Any, rows: list, mode: Optional[str]) -> None:
+    """db 为 Session 或 Connection。"""
+    if not rows or not mode:
+        return
+    if mode == "fts5":
+        params = [{"id": uid, "e": email or "", "p": phone or ""} for uid, email, phone in rows]
+        db.execute(_FTS_INSERT_ROWID, params)
+        db.execute(_FTS_INSERT, params)
+        return
+    params = [{"gram": g, "user_id": uid} for uid, email, phone in rows for g in _grams([email, phone, uid])]
+    if params:
+        db.execute(user_search_ngrams.insert(), params)
+
+
+def remove_user(db: Session, user_id: str) -> None:
+    remove_users(db, [user_id])
+
+
+def remove_users(db: Session, user_ids: list) -> None:
+    """批量删除索引条目（调用方负责分块）。FTS5 经 user_search_rowids 取 rowid 后按 rowid 删除，不扫描索引。"""
+    if not user_ids:
+        return
+    if _mode == "fts5":
+        params = {"ids": list(user_ids)}
+        ids = bindparam("ids", expanding=True)
+        rowids = db.execute(
+            text("SELECT rowid FROM user_search_rowids WHERE user_id IN :ids").bindparams(ids), params
+        ).scalars().all()
+        if rowids:
+            db.execute(text("DELETE FROM users_search WHERE rowid = :r"), [{"r": r} for r in rowids])
+        db.execute(text("DELETE FROM user_search_rowids WHERE user_id IN :ids").bindparams(ids), params)
+    elif _mode == "ngram":
+        db.execute(user_search_ngrams.delete().where(user_search_ngrams.c.user_id.in_(user_ids)))
+
+
+def matching_ids(q: str) -> Optional[Any]:
+    """返回可用于 User.id.in_(...) 的子查询；不可用时返回 None。"""
+    q = (q or "").strip()
+    if len(q) < GRAM or not _mode:
+        return None
+    if _mode == "fts5":
+        return text("SELECT user_id FROM users_search WHERE users_search MATCH :q").bindparams(
+            q=_fts_phrase(q)
+        ).columns(column("user_id"))
+    grams = _grams([q])
+    return (
+        select(user_search_ngrams.c.user_id)
+        .where(user_search_ngrams.c.gram.in_(grams))
+        .group_by(user_search_ngrams.c.user_id)
+        .having(func.count(func.distinct(user_search_ngrams.c.gram)) == len(grams))
+    )
+
+
+def is_exact() -> bool:
+    """FTS5 trigram 短语匹配即子串匹配；n-gram 候选需再做 ilike 精确过滤。"""
+    return _mode == "fts5"
@@ -0,0 +1,118 @@
+"""access_token 非对称签名（ES256）与 JWKS。
+JWT_ALGORITHM=ES256 时用 JWT_PRIVATE_KEY_PATH（EC P-256 PEM）签发 access_token，header 带 kid；
+JWT_PREVIOUS_PUBLIC_KEY_PATH 为上一把公钥，在轮换重叠期内继续出现在 JWKS 中并用于校验。
+下游服务从 /.well-known/jwks.json 取公钥即可离线校验，无需再调 /me。
+refresh / admin token 只由本服务校验，仍为 HS256。
+切换前签发的 HS256 access_token 只在 JWT_HS256_ACCEPT_UNTIL 之前接受（默认 0：切换后即不接受）。
+
+轮换：生成新私钥 -> 旧私钥导出公钥配置为 PREVIOUS -> 重启；
+ACCESS_TOKEN_EXPIRE_MINUTES（加下游 JWKS 缓存时间）之后移除 PREVIOUS。
+  openssl ecparam -name prime256v1 -genkey -noout | openssl pkcs8 -topk8 -nocrypt -out jwt_es256.pem
+"""
+import base64
+import hashlib
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+ES256 = "ES256"
+
+
+@dataclass(frozen=True)
+class VerifyKey:
+    kid: str
+    public_pem: str
+    jwk: dict
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _public_jwk(public_key: ec.EllipticCurvePublicKey, kid: Optional[str]) -> VerifyKey:
+    if not isinstance(public_key.curve, ec.SECP256R1):
+        raise ValueError("ES256 requires an EC P-256 key")
+    numbers = public_key.public_numbers()
+    x = _b64url(numbers.x.to_bytes(32, "big"))
+    y = _b64url(numbers.y.to_bytes(32, "big"))
+    if not kid:
+        # RFC 7638 thumbprint
+        canonical = json.dumps({"crv": "P-256", "kty": "EC", "x": x, "y": y}, separators=(",", ":"), sort_keys=True)
+        kid = _b64url(hashlib.sha256(canonical.encode()).digest())[:16]
+    pem = public_key.public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    jwk = {"kty": "EC", "crv": "P-256", "x": x, "y": y, "use": "sig", "alg": ES256, "kid": kid}
+    return VerifyKey(kid=kid, public_pem=pem, jwk=jwk)
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class _KeySet:
+    def __init__(self):
+        self.private_pem: Optional[str] = None
+        self.current: Optional[VerifyKey] = None
+        self.by_kid: dict = {}
+
+    def load(self) -> None:
+        if settings.JWT_ALGORITHM != ES256:
+            return
+        if not settings.JWT_PRIVATE_KEY_PATH:
+            raise RuntimeError("JWT_ALGORITHM=ES256 requires JWT_PRIVATE_KEY_PATH")
+        private_key = serialization.load_pem_private_key(_read(settings.JWT_PRIVATE_KEY_PATH), password=None)
+        self.private_pem = private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ).decode()
+        self.current = _public_jwk(private_key.public_key(), settings.JWT_KEY_ID)
+        self.by_kid = {self.current.kid: self.current}
+        if settings.JWT_PREVIOUS_PUBLIC_KEY_PATH:
+            previous = _public_jwk(
+                serialization.load_pem_public_key(_read(settings.JWT_PREVIOUS_PUBLIC_KEY_PATH)),
+                settings.JWT_PREVIOUS_KEY_ID,
+            )
+            if previous.kid != self.current.kid:
+                self.by_kid[previous.kid] = previous
+        logger.info("ES256 signing enabled, kid=%s, verify kids=%s", self.current.kid, list(self.by_kid))
+
+
+_keys = _KeySet()
+_keys.load()
+
+
+def enabled() -> bool:
+    return _keys.current is not None
+
+
+def signing_key() -> tuple:
+    """(私钥 PEM, kid)；仅 enabled() 时调用。"""
+    return _keys.private_pem, _keys.current.kid
+
+
+def verify_key(kid: Optional[str]) -> Optional[str]:
+    """按 kid 取公钥 PEM；未知 kid 返回 None。"""
+    key = _keys.by_kid.get(kid) if kid else None
+    return key.public_pem if key else None
+
+
+def hs256_accepted(now_ts: Optional[float] = None) -> bool:
+    """HS256 access_token 是否仍可接受：未启用 ES256 时恒为 True；启用后只在 JWT_HS256_ACCEPT_UNTIL 之前。"""
+    if not enabled():
+        return True
+    now_ts = time.time() if now_ts is None else now_ts
+    return now_ts < settings.JWT_HS256_ACCEPT_UNTIL
+
+
+def jwks() -> dict:
+    return {"keys": [k.jwk for k in _keys.by_kid.values()]}
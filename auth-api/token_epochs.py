@@ -0,0 +1,117 @@
+"""按用户的 token 纪元（users.token_epoch）：禁用、重置密码、删除时 +1，access_token 的 te claim 小于当前纪元即失效。
+校验只查进程内字典（O(1)，不读库）；字典只收录纪元 > 0 的用户：
+- 启动时全量加载一次（token_epoch_at 范围条件，走 ix_users_token_epoch_at；bump 总是同时写两列）
+- 本进程 bump 提交后立即生效（observe）
+- 后台每 TOKEN_EPOCH_REFRESH_SECONDS 按 token_epoch_at 索引增量拉取其他 worker 的变更
+删除用户时行已不存在，其他 worker 由快照回库（用户不存在）兜底，最多滞后 USER_CACHE_TTL_SECONDS。
+"""
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+from database import SessionLocal
+from models import User
+
+logger = logging.getLogger(__name__)
+
+# 增量拉取的回看窗口：覆盖“先取时间戳、后提交”的事务与 worker 间时钟偏差
+_OVERLAP = timedelta(seconds=10)
+_NEVER = datetime(1970, 1, 1)
+
+_epochs: dict = {}
+_lock = threading.Lock()
+_watermark: Optional[datetime] = None
+
+
+def current(user_id: str) -> int:
+    return _epochs.get(user_id, 0)
+
+
+def is_revoked(user_id: str, token_epoch: Optional[int]) -> bool:
+    """token 签发时的纪元（未携带按 0）落后于当前纪元即视为已吊销。"""
+    return (token_epoch or 0) < _epochs.get(user_id, 0)
+
+
+def observe(user_id: str, epoch: Optional[int]) -> None:
+    """读到用户行时顺带推进本地纪元（只增不减）。"""
+    if not epoch:
+        return
+    with _lock:
+        if epoch > _epochs.get(user_id, 0):
+            _epochs[user_id] = epoch
+
+
+def bump(db: Session, user_id: str) -> int:
+    """users.token_epoch +1（不 commit），返回新纪元；调用方 commit 后再 observe(user_id, epoch)。"""
+    db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(token_epoch=func.coalesce(User.token_epoch, 0) + 1, token_epoch_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return db.execute(select(User.token_epoch).where(User.id == user_id)).scalar() or 0
+
+
+def bump_many(db: Session, user_ids: list) -> dict:
+    """批量 +1（一条 UPDATE，不 commit），返回 {user_id: 新纪元}；调用方 commit 后逐个 observe。"""
+    if not user_ids:
+        return {}
+    db.execute(
+        update(User)
+        .where(User.id.in_(user_ids))
+        .values(token_epoch=func.coalesce(User.token_epoch, 0) + 1, token_epoch_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return dict(db.execute(select(User.id, User.token_epoch).where(User.id.in_(user_ids))).all())
+
+
+def _load(since: Optional[datetime]) -> list:
+    db = SessionLocal()
+    try:
+        q = select(User.id, User.token_epoch, User.token_epoch_at)
+        if since is None:
+            # 等价于 IS NOT NULL，但 SQLite 只对范围条件使用索引
+            q = q.where(User.token_epoch_at > _NEVER)
+        else:
+            q = q.where(User.token_epoch_at >= since)
+        return db.execute(q).all()
+    finally:
+        db.close()
+
+
+def refresh_once() -> int:
+    """首次全量加载，之后按 token_epoch_at 增量拉取；返回本轮读到的行数。"""
+    global _watermark
+    since = _watermark - _OVERLAP if _watermark is not None else None
+    rows = _load(since)
+    for user_id, epoch, _ in rows:
+        observe(user_id, epoch)
+    latest = max((r[2] for r in rows if r[2] is not None), default=None)
+    if _watermark is None:
+        _watermark = latest or datetime.utcnow()
+    elif latest is not None and latest > _watermark:
+        _watermark = latest
+    return len(rows)
+
+
+def init() -> None:
+    n = refresh_once()
+    logger.info("loaded %d token epochs", n)
+
+
+async def run_refresher() -> None:
+    while True:
+        await asyncio.sleep(settings.TOKEN_EPOCH_REFRESH_SECONDS)
+        try:
+            await run_in_threadpool(refresh_once)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("token epoch refresh failed")
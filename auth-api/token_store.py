@@ -0,0 +1,157 @@
+"""refresh_token 存储：签发、校验、吊销、轮换。
+校验顺序：JWT 签名/过期 -> 吊销过滤器（内存）-> 有效缓存（内存）-> refresh_tokens.token_hash 索引查询。
+吊销在本进程立即生效；其他 worker 的有效缓存最多滞后 REFRESH_VALID_CACHE_TTL_SECONDS。
+"""
+import hashlib
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from cache import TTLCache
+from config import settings
+from deps import create_refresh_token, decode_refresh_token
+from models import RefreshToken
+
+_MAX_TTL = settings.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600
+
+# 最近吊销的 token_hash -> True；TTL 取 token 剩余有效期，过期后 JWT 校验本身就会拒绝
+_revoked = TTLCache(maxsize=settings.REFRESH_REVOKED_FILTER_MAX_SIZE, ttl=_MAX_TTL)
+# 已在库中确认有效的 token_hash -> user_id
+_valid = TTLCache(maxsize=settings.REFRESH_VALID_CACHE_MAX_SIZE, ttl=settings.REFRESH_VALID_CACHE_TTL_SECONDS)
+
+
+def token_hash(raw: str) -> str:
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _remaining_seconds(expires_at: Optional[datetime], now: datetime) -> float:
+    if expires_at is None:
+        return _MAX_TTL
+    return max(0.0, (expires_at - now).total_seconds())
+
+
+def _mark_revoked(hashed: str, expires_at: Optional[datetime], now: datetime) -> None:
+    _valid.pop(hashed)
+    _revoked.set(hashed, True, ttl=_remaining_seconds(expires_at, now))
+
+
+def discard(hashed: str) -> None:
+    """行已被删除（如后台清理）：移出有效缓存，下次校验回库即失败。"""
+    _valid.pop(hashed)
+
+
+def issue(db: Session, user_id: str, now: Optional[datetime] = None) -> str:
+    """签发 refresh_token 并写入 refresh_tokens（只存 hash），由调用方 commit。"""
+    now = now or datetime.utcnow()
+    refresh_raw = create_refresh_token(user_id)
+    rt = RefreshToken(
+        id=str(uuid.uuid4()),
+        user_id=user_id,
+        token_hash=token_hash(refresh_raw),
+        expires_at=now + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+        created_at=now,
+    )
+    db.add(rt)
+    return refresh_raw
+
+
+def validate(db: Session, raw: str) -> Optional[str]:
+    """校验 refresh_token：签名、类型、过期，且库中存在、未吊销、未过期。成功返回 user_id。"""
+    user_id = decode_refresh_token(raw)
+    if not user_id:
+        return None
+    hashed = token_hash(raw)
+    if _revoked.get(hashed):
+        return None
+    cached = _valid.get(hashed)
+    if cached is not None:
+        return cached if cached == user_id else None
+    now = datetime.utcnow()
+    row = db.query(RefreshToken).filter(RefreshToken.token_hash == hashed).first()
+    if row is None or row.user_id != user_id:
+        return None
+    if row.revoked_at is not None:
+        _mark_revoked(hashed, row.expires_at, now)
+        return None
+    if row.expires_at <= now:
+        return None
+    _valid.set(hashed, user_id, ttl=_remaining_seconds(row.expires_at, now))
+    return user_id
+
+
+def revoke(db: Session, raw: str) -> bool:
+    """吊销单个 refresh_token 并 commit；返回是否有行被吊销。"""
+    hashed = token_hash(raw)
+    now = datetime.utcnow()
+    rows = (
+        db.query(RefreshToken)
+        .filter(RefreshToken.token_hash == hashed, RefreshToken.revoked_at.is_(None))
+        .all()
+    )
+    for row in rows:
+        row.revoked_at = now
+    db.commit()
+    for row in rows:
+        _mark_revoked(hashed, row.expires_at, now)
+    return bool(rows)
+
+
+def rotate(db: Session, raw: str, user_id: str) -> str:
+    """吊销旧 token 并签发新 token（同一事务），返回新的 refresh_token。调用前应已 validate。"""
+    hashed = token_hash(raw)
+    now = datetime.utcnow()
+    rows = (
+        db.query(RefreshToken)
+        .filter(RefreshToken.token_hash == hashed, RefreshToken.revoked_at.is_(None))
+        .all()
+    )
+    for row in rows:
+        row.revoked_at = now
+    new_raw = issue(db, user_id, now)
+    db.commit()
+    for row in rows:
+        _mark_revoked(hashed, row.expires_at, now)
+    return new_raw
+
+
+def revoke_all_for_users(db: Session, user_ids: list, now: datetime) -> list:
+    """批量吊销多个用户的 refresh_token（一条 UPDATE，不 commit）；返回 (token_hash, expires_at) 列表，
+    调用方 commit 后交给 mark_revoked 写入内存过滤器。"""
+    if not user_ids:
+        return []
+    rows = (
+        db.query(RefreshToken.token_hash, RefreshToken.expires_at)
+        .filter(RefreshToken.user_id.in_(user_ids), RefreshToken.revoked_at.is_(None))
+        .all()
+    )
+    if rows:
+        db.query(RefreshToken).filter(
+            RefreshToken.user_id.in_(user_ids), RefreshToken.revoked_at.is_(None)
+        ).update({RefreshToken.revoked_at: now}, synchronize_session=False)
+    return rows
+
+
+def mark_revoked(rows: list, now: datetime) -> None:
+    for hashed, expires_at in rows:
+        _mark_revoked(hashed, expires_at, now)
+
+
+def revoke_all_for_user(db: Session, user_id: str) -> int:
+    """吊销用户全部未吊销的 refresh_token 并 commit；返回吊销条数。"""
+    now = datetime.utcnow()
+    rows = (
+        db.query(RefreshToken.token_hash, RefreshToken.expires_at)
+        .filter(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+        .all()
+    )
+    if not rows:
+        return 0
+    db.query(RefreshToken).filter(
+        RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None)
+    ).update({RefreshToken.revoked_at: now}, synchronize_session=False)
+    db.commit()
+    for hashed, expires_at in rows:
+        _mark_revoked(hashed, expires_at, now)
+    return len(rows)
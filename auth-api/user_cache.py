@@ -0,0 +1,106 @@
+"""get_current_user 的用户快照缓存：按 user_id 缓存只读快照（有界 + TTL），含 entitlements 权益与 state_version。
+管理员禁用/启用/删除/重置密码与登录会显式失效；多 worker 部署时其他进程最多滞后 USER_CACHE_TTL_SECONDS。
+另维护权益版本计数（user_id -> entitlements.version，只存整数，容量远大于快照），
+用于判断 access_token 中的权益 claims 是否仍是最新，命中时无需读库。
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+import token_epochs
+from cache import TTLCache
+from config import settings
+from models import Entitlement, User
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """User 的只读副本，字段与 models.User 同名，可直接用于响应拼装。"""
+
+    id: str
+    email: Optional[str]
+    phone: Optional[str]
+    status: Optional[str]
+    plan: Optional[str]
+    created_at: Optional[datetime]
+    last_login_at: Optional[datetime]
+    trial_start_at: Optional[datetime]
+    trial_end_at: Optional[datetime]
+    state_version: int = 0
+    # entitlements 中的试用起止与订阅到期（unix 秒），无记录为 None；plan 为 entitlements.plan（未换算）
+    trial_start_ts: Optional[int] = None
+    trial_end_ts: Optional[int] = None
+    subscription_expires_ts: Optional[int] = None
+    entitlement_version: int = 0
+    token_epoch: int = 0
+
+    @classmethod
+    def from_user(cls, user: User, entitlement: Optional[Entitlement] = None) -> "UserSnapshot":
+        ent = entitlement
+        return cls(
+            id=user.id,
+            email=user.email,
+            phone=user.phone,
+            status=user.status,
+            plan=ent.plan if ent is not None else user.plan,
+            created_at=user.created_at,
+            last_login_at=user.last_login_at,
+            trial_start_at=user.trial_start_at,
+            trial_end_at=user.trial_end_at,
+            state_version=user.state_version or 0,
+            trial_start_ts=ent.trial_start_ts if ent is not None else None,
+            trial_end_ts=ent.trial_end_ts if ent is not None else None,
+            subscription_expires_ts=ent.subscription_expires_ts if ent is not None else None,
+            entitlement_version=(ent.version or 0) if ent is not None else 0,
+            token_epoch=user.token_epoch or 0,
+        )
+
+
+_cache = TTLCache(maxsize=settings.USER_CACHE_MAX_SIZE, ttl=settings.USER_CACHE_TTL_SECONDS)
+_versions = TTLCache(maxsize=settings.ENTITLEMENT_VERSION_CACHE_SIZE, ttl=settings.USER_CACHE_TTL_SECONDS)
+
+
+def get(user_id: str) -> Optional[UserSnapshot]:
+    return _cache.get(user_id)
+
+
+def entitlement_version(user_id: str) -> Optional[int]:
+    """本进程已知的最新权益版本；未知（未加载或已失效）返回 None。"""
+    return _versions.get(user_id)
+
+
+def put(user: User, entitlement: Optional[Entitlement] = None) -> UserSnapshot:
+    snapshot = UserSnapshot.from_user(user, entitlement)
+    _cache.set(user.id, snapshot)
+    _versions.set(user.id, snapshot.entitlement_version)
+    token_epochs.observe(user.id, snapshot.token_epoch)
+    return snapshot
+
+
+def invalidate(user_id: str) -> None:
+    _cache.pop(user_id)
+    _versions.pop(user_id)
+
+
+def bump_state_version(db: Session, user_id: str) -> None:
+    """users.state_version +1（不 commit）；调用方 commit 后再 invalidate。"""
+    db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(state_version=func.coalesce(User.state_version, 0) + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def bump_state_versions(db: Session, user_ids: list) -> None:
+    """批量 users.state_version +1（一条 UPDATE，不 commit）。"""
+    if user_ids:
+        db.execute(
+            update(User)
+            .where(User.id.in_(user_ids))
+            .values(state_version=func.coalesce(User.state_version, 0) + 1)
+            .execution_options(synchronize_session=False)
+        )
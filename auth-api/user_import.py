@@ -0,0 +1,265 @@
+"""批量导入用户（管理端 POST /admin/users:import 与离线脚本 import_users.py 共用）。
+每行一条记录（NDJSON 或带表头的 CSV），字段：
+- username（或 identifier）：邮箱或手机号，必填
+- password_hash：已有 bcrypt hash（$2a$/$2b$/$2y$），或 password：明文，由调用方在进程池中 hash
+- 可选：created_at（ISO 时间）、status（active / disabled）、plan、trial_end（unix 秒）
+按批处理：批内去重 -> 按 email / phone 唯一索引 IN 查询剔除已存在账号 -> 调用方 hash 明文 ->
+users、entitlements、subscriptions、搜索索引 executemany 写入，每批一次 commit。
+批次之间靠数据库去重（前一批已提交），内存只与批大小有关。
+"""
+import asyncio
+import csv
+import json
+import re
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import entitlements
+import password_hasher
+import search_index
+from models import Entitlement, Subscription, User
+
+BATCH_SIZE = 1000
+_LOOKUP_CHUNK = 500
+_MAX_ERRORS = 100
+_INSERT_ATTEMPTS = 5
+_EPOCH = datetime(1970, 1, 1)
+# 与 bcrypt.checkpw 的解析规则一致：cost 04~31；盐 22 个字符编码 16 字节，末字符只剩 2 位有效，只能是 . O e u
+# （逐条 checkpw 即使按最小 cost 也要约 1.6ms，百万行导入不可接受）
+_BCRYPT_RE = re.compile(r"^\$2[aby]\$(0[4-9]|[12]\d|3[01])\$[./A-Za-z0-9]{21}[.Oeu][./A-Za-z0-9]{31}$")
+
+
+def _is_email(s: str) -> bool:
+    return bool(re.match(r"^[^\s@]+@[^\s@]+\.[^\s@]+$", s))
+
+
+def _is_phone(s: str) -> bool:
+    return bool(re.match(r"^1[3-9]\d{9}$", s))
+
+
+@dataclass
+class ImportStats:
+    total: int = 0
+    imported: int = 0
+    skipped_existing: int = 0
+    invalid: int = 0
+    errors: list = field(default_factory=list)  # 前 _MAX_ERRORS 条 {"line", "reason"}
+
+    def error(self, line_no: int, reason: str) -> None:
+        self.invalid += 1
+        if len(self.errors) < _MAX_ERRORS:
+            self.errors.append({"line": line_no, "reason": reason})
+
+    def as_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "imported": self.imported,
+            "skipped_existing": self.skipped_existing,
+            "invalid": self.invalid,
+            "errors": self.errors,
+        }
+
+
+class LineParser:
+    """逐行解析 NDJSON / CSV（CSV 第一行为表头）；返回 dict，空行返回 None。"""
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.header: Optional[list] = None
+
+    def parse(self, line: str) -> Optional[dict]:
+        line = line.strip("\r\n")
+        if not line.strip():
+            return None
+        if self.fmt == "csv":
+            values = next(csv.reader([line]))
+            if self.header is None:
+                self.header = [v.strip().lower() for v in values]
+                return None
+            return dict(zip(self.header, values))
+        obj = json.loads(line)
+        if not isinstance(obj, dict):
+            raise ValueError("not an object")
+        return obj
+
+
+def _opt_int(value) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+def validate(raw: dict) -> dict:
+    """规范化一条记录；不合法抛 ValueError（消息即错误原因）。"""
+    identifier = str(raw.get("username") or raw.get("identifier") or "").strip()
+    if not (_is_email(identifier) or _is_phone(identifier)):
+        raise ValueError("invalid username")
+    password_hash = str(raw.get("password_hash") or "").strip()
+    password = raw.get("password")
+    if password_hash:
+        if not _BCRYPT_RE.match(password_hash):
+            raise ValueError("invalid password_hash")
+    elif not password or len(str(password)) < 6:
+        raise ValueError("missing password")
+    created_at = raw.get("created_at")
+    status = str(raw.get("status") or "active").strip().lower()
+    if status not in ("active", "disabled"):
+        raise ValueError("invalid status")
+    try:
+        trial_end = _opt_int(raw.get("trial_end"))
+        created = datetime.fromisoformat(str(created_at).replace("Z", "+00:00")) if created_at else None
+    except (TypeError, ValueError):
+        raise ValueError("invalid trial_end or created_at")
+    if created is not None and created.tzinfo is not None:
+        created = created.astimezone(timezone.utc).replace(tzinfo=None)
+    return {
+        "email": identifier if _is_email(identifier) else None,
+        "phone": identifier if _is_phone(identifier) else None,
+        "password_hash": password_hash or None,
+        "password": None if password_hash else str(password),
+        "created_at": created,
+        "status": status,
+        "plan": str(raw.get("plan") or entitlements.FREE).strip()[:32],
+        "trial_end": trial_end,
+    }
+
+
+def filter_new(db: Session, batch: list) -> tuple:
+    """批内去重并剔除库中已存在的 email / phone（唯一索引 IN 查询），返回 (新记录, 跳过数)。"""
+    seen = set()
+    unique = []
+    for rec in batch:
+        key = rec["email"] or rec["phone"]
+        if key not in seen:
+            seen.add(key)
+            unique.append(rec)
+    emails = [r["email"] for r in unique if r["email"]]
+    phones = [r["phone"] for r in unique if r["phone"]]
+    existing = set()
+    for i in range(0, len(emails), _LOOKUP_CHUNK):
+        existing.update(db.execute(select(User.email).where(User.email.in_(emails[i:i + _LOOKUP_CHUNK]))).scalars())
+    for i in range(0, len(phones), _LOOKUP_CHUNK):
+        existing.update(db.execute(select(User.phone).where(User.phone.in_(phones[i:i + _LOOKUP_CHUNK]))).scalars())
+    new = [r for r in unique if (r["email"] or r["phone"]) not in existing]
+    return new, len(batch) - len(new)
+
+
+async def hash_plaintext(batch: list) -> None:
+    """经 bcrypt 进程池 hash 批内的明文密码（原地替换），并发度为 worker 数；进程池满时稍后重试而不是失败。"""
+    sem = asyncio.Semaphore(password_hasher.worker_count())
+
+    async def _one(rec: dict) -> None:
+        async with sem:
+            while True:
+                try:
+                    rec["password_hash"] = await password_hasher.hash_password(rec["password"])
+                    break
+                except password_hasher.PasswordHasherBusy:
+                    await asyncio.sleep(0.05)
+        rec["password"] = None
+
+    await asyncio.gather(*(_one(r) for r in batch if r["password_hash"] is None))
+
+
+def _insert(db: Session, batch: list) -> None:
+    now = datetime.utcnow()
+    users, ents, subs, index_rows = [], [], [], []
+    for rec in batch:
+        uid = str(uuid.uuid4())
+        users.append({
+            "id": uid,
+            "email": rec["email"],
+            "phone": rec["phone"],
+            "password_hash": rec["password_hash"],
+            "created_at": rec["created_at"] or now,
+            "status": rec["status"],
+            "plan": entitlements.FREE,
+            "state_version": 0,
+            "token_epoch": 0,
+        })
+        # 有试用结束时间就同时写开始时间（导入的 created_at，否则导入时刻），/auth/status 只在两者都有时返回试用信息
+        trial_start = None
+        if rec["trial_end"] is not None:
+            trial_start = min(int(((rec["created_at"] or now) - _EPOCH).total_seconds()), rec["trial_end"])
+        ents.append({
+            "user_id": uid,
+            "plan": rec["plan"],
+            "trial_start_ts": trial_start,
+            "trial_end_ts": rec["trial_end"],
+            "subscription_expires_ts": None,
+            "version": 0,
+            "updated_at": now,
+        })
+        subs.append({
+            "id": str(uuid.uuid4()),
+            "user_id": uid,
+            "plan": entitlements.FREE,
+            "status": "active",
+            "current_period_end": None,
+            "features_json": [],
+        })
+        index_rows.append((uid, rec["email"], rec["phone"]))
+    db.execute(User.__table__.insert(), users)
+    db.execute(Entitlement.__table__.insert(), ents)
+    db.execute(Subscription.__table__.insert(), subs)
+    search_index.add_many(db, index_rows)
+
+
+def insert_batch(db: Session, batch: list) -> tuple:
+    """写入一批已 hash 的新记录并 commit，返回 (写入数, 跳过数)。
+    与并发注册撞上唯一索引时回滚，重新去重（跳过已被注册的账号）后重写，最多 _INSERT_ATTEMPTS 次。"""
+    skipped = 0
+    for attempt in range(1, _INSERT_ATTEMPTS + 1):
+        if not batch:
+            break
+        try:
+            _insert(db, batch)
+            db.commit()
+            return len(batch), skipped
+        except IntegrityError:
+            db.rollback()
+            if attempt == _INSERT_ATTEMPTS:
+                raise
+        batch, n = filter_new(db, batch)
+        skipped += n
+    return 0, skipped
+
+
+def read_batches(lines: Iterable, fmt: str, stats: ImportStats, batch_size: int = BATCH_SIZE):
+    """同步迭代行，产出已校验的记录批次（离线脚本使用；接口侧用 LineParser 按流自行分批）。"""
+    parser = LineParser(fmt)
+    batch = []
+    for line_no, line in enumerate(lines, 1):
+        rec = parse_record(parser, line, line_no, stats)
+        if rec is None:
+            continue
+        batch.append(rec)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def parse_record(parser: LineParser, line: str, line_no: int, stats: ImportStats) -> Optional[dict]:
+    """解析并校验一行；空行与 CSV 表头返回 None，不合法的记录计入 stats 后返回 None。"""
+    try:
+        raw = parser.parse(line)
+    except (ValueError, csv.Error):
+        stats.total += 1
+        stats.error(line_no, "malformed line")
+        return None
+    if raw is None:
+        return None
+    stats.total += 1
+    try:
+        return validate(raw)
+    except ValueError as e:
+        stats.error(line_no, str(e))
+        return None
@@ -134,6 +134,23 @@ export async function getMe(): Promise<ApiResult<MeResponse>> {
   return requestWithRefresh<MeResponse>('GET', '/me')
 }
 
+/** GET /auth/bootstrap 返回：/me + /auth/status + /auth/trial/status + 订阅，一次请求拿齐 */
+export interface BootstrapResponse extends MeResponse {
+  status: UserStatus
+  trial: { hasTrial: boolean; trialEndsAt: number | null; isActive: boolean }
+  subscription: {
+    plan: string
+    status: string
+    current_period_end: string | null
+    features: string[]
+  }
+}
+
+/** GET /auth/bootstrap：启动/聚焦时使用；旧版服务端返回 404 时由调用方回退到 getMe + getUserStatus */
+export async function getBootstrap(): Promise<ApiResult<BootstrapResponse>> {
+  return requestWithRefresh<BootstrapResponse>('GET', '/auth/bootstrap')
+}
+
 /**
  * GET /auth/status：获取当前用户状态（只读）。使用 access_token，不做 fallback/mock。
  * 失败时只记录日志，返回 null，不登出、不弹窗。
@@ -154,6 +171,8 @@ export interface TrialStartResponse {
   success: boolean
   start_ts?: number
   end_ts?: number
+  /** 内嵌新权益 claims 的 access_token，客户端应替换当前 token */
+  access_token?: string
 }
 
 /** 后端 GET /auth/trial/status 返回 */
@@ -5,7 +5,15 @@ import {
   AUTH_REMEMBER_ME_KEY,
   AUTH_ZUSTAND_PERSIST_KEY,
 } from '@/constants/authStorageKeys'
-import { getMe, getTrialStatus, getUserStatus, startTrial } from '../services/apiClient'
+import {
+  type ApiResult,
+  getBootstrap,
+  getMe,
+  getTrialStatus,
+  getUserStatus,
+  type MeResponse,
+  startTrial,
+} from '../services/apiClient'
 import { MockAuthService } from '../services/MockAuthService'
 import type {
   AuthResponse,
@@ -364,7 +372,24 @@ export const useAuthStore = create<AuthStore>()(
           return
         }
 
-        const result = await getMe()
+        const boot = await getBootstrap()
+        if (boot.ok && boot.data?.username != null) {
+          set({
+            isAuthenticated: true,
+            user: safeUserFromUsername(boot.data.username),
+            isLoading: false,
+            authCheckDone: true,
+            isOffline: false,
+            error: null,
+          })
+          get().setUserStatus(boot.data.status)
+          console.log('[USER-STATUS]', boot.data.status)
+          return
+        }
+
+        // 旧版服务端没有 /auth/bootstrap（404）：回退到 /me + /auth/status
+        const result: ApiResult<MeResponse> =
+          boot.ok || boot.status === 404 ? await getMe() : boot
 
         if (result.ok && result.data?.username != null) {
           set({
@@ -444,6 +469,9 @@ export const useAuthStore = create<AuthStore>()(
         if (!result.data?.success) {
           return { success: false as const, message: '开通试用失败' }
         }
+        if (result.data.access_token) {
+          set({ token: result.data.access_token })
+        }
         const username = get().user?.username ?? ''
         const statusResult = await getTrialStatus(username)
         const statusData = statusResult.ok ? statusResult.data : null